@@ -6,24 +6,38 @@
 #
 # V0.1.0 Dec 2025 Initial version
 # V0.1.1 Dec 2025 Fixed initialization of screen
+# V0.2.0 Oct 2026 Zero-copy framebuffer transmit, one transaction per controller
 #
 # Released under the MIT License (MIT).
 # Copyright (c) 2025 Ignas Bukys
 
 
 from micropython import const
-from time import sleep_ms
+import gc
+from time import sleep_ms, ticks_ms, ticks_us, ticks_diff, time
+from binascii import crc32
 import framebuf
-from ustruct import pack
-from io import BytesIO
-from machine import SPI, Pin
+from machine import SPI, Pin, lightsleep
+from array import array
+from kernels import transpose_band, reverse_band
 
-__version__ = (0, 1, 1)
+__version__ = (0, 2, 0)
 
 # Display colour codes
 COLOR_WHITE = const(1)
 COLOR_BLACK = const(0)
 
+
+def _compile(*commands):
+    '''Build a command table from (command, param, param, ...) tuples
+
+    Returns a tuple of (command, params) pairs where params is a bytes
+    object (empty when the command takes none). Tables are built once at
+    import so sending them allocates nothing.
+    '''
+    return tuple((c[0], bytes(c[1:])) for c in commands)
+
+
 #generic class for chip
 class SSD1683(framebuf.FrameBuffer):
     '''Low-level controls for E-Paper chip'''
@@ -86,12 +100,63 @@ class SSD1683(framebuf.FrameBuffer):
     ROTATION_180 = const(2)
     ROTATION_270 = const(3)
 
-
-    def __init__(self, w, h, rotation=ROTATION_0):
+    FILL_CHUNK = const(100)     # Size of the pattern buffer used by _fill()
+
+    # Layout of self.buffer, lets writer.Writer draw into it directly
+    FB_FORMAT = framebuf.MONO_HLSB
+
+    # BUSY handling
+    BUSY_TIMEOUT_MS = 10_000    # Longest accepted busy period
+    BUSY_SLICE_MS = 20          # Sleep granularity while waiting
+
+    # Operating range of the temperature sensor, other reads are rejected
+    TEMP_MIN_C = -40
+    TEMP_MAX_C = 85
+
+    # Static command tables, see _cmd_seq()
+    SEQ_TEMP_SENSOR = _compile(
+        (SET_TEMP_CONTROL, 0x80),           # Read built-in temperature sensor
+        (SET_DISP_CTRL2, 0xB1),             # Load temperature value
+        (SET_MASTER_ACTIVATE,))
+    SEQ_TEMP_FAST = _compile(
+        (SET_TEMP_WRITE, 0x64, 0x00),       # Write to temperature register
+        (SET_DISP_CTRL2, 0x91),             # Load temperature value
+        (SET_MASTER_ACTIVATE,))
+    SEQ_BORDER = _compile(
+        (SET_WRITE_BORDER, 0x01))           # 0x3 | 0-ryškus 1-jokio 2-jokio
+    SEQ_RAM_MP = _compile(
+        (SET_DATA_MODE, 0x02),              # Data Entry mode setting; X decrement, Y increment
+        (SET_RAMXPOS, 0x31, 0x00),          # Set Ram X- address Start / End position
+        (SET_RAMYPOS, 0x00, 0x00, 0x0f, 0x01))  # Set Ram Y- address Start / End position
+    SEQ_RAM_MA = _compile(
+        (SET_RAMXCOUNT, 0x31),
+        (SET_RAMYCOUNT, 0x00, 0x00))
+    SEQ_RAM_SP = _compile(
+        (SET_DATA_MODE_SLAVE, 0x03),
+        (SET_RAMXPOS_SLAVE, 0x00, 0x31),
+        (SET_RAMYPOS_SLAVE, 0x00, 0x00, 0x0f, 0x01))
+    SEQ_RAM_SA = _compile(
+        (SET_RAMXCOUNT_SLAVE, 0x00),
+        (SET_RAMYCOUNT_SLAVE, 0x00, 0x00))
+    SEQ_UPDATE = _compile((SET_DISP_CTRL2, 0xF7), (SET_MASTER_ACTIVATE,))
+    SEQ_PART_UPDATE = _compile((SET_DISP_CTRL2, 0xDC), (SET_MASTER_ACTIVATE,))
+    SEQ_FAST_UPDATE = _compile((SET_DISP_CTRL2, 0xC7), (SET_MASTER_ACTIVATE,))
+
+
+    def __init__(self, w, h, rotation=ROTATION_0, init=True):
+        self.busy_timeout_ms = self.BUSY_TIMEOUT_MS
+        self.busy_lightsleep = False    # Light sleep the core while BUSY is high
+        self.refresh_ms = {}            # Last duration of Update/FastUpdate/PartUpdate
+        self._busy_edge = None
+        self._busy_cb = self._on_busy_edge  # Bound once, IRQ arming allocates nothing
+        self.temperature = None         # °C from the built-in sensor, read at init
+        self.asleep = False             # In deep sleep, see sleep()/wake()
+        self._ram_retained = True
         self._init_spi()
         self._init_buffer(w, h, rotation)
-        self.FastMode1Init()
-        self.HW_RESET()
+        if init:
+            self.FastMode1Init()
+            self.HW_RESET()
 
     def _init_spi(self):
         #Set pin 7 to high level to activate the screen power
@@ -102,6 +167,23 @@ class SSD1683(framebuf.FrameBuffer):
         self.rst = Pin(self.RESET_PIN, Pin.OUT)
         self.busy = Pin(self.BUSY_PIN, Pin.IN)
 
+        self._init_bus()
+        self.cs.init(self.cs.OUT, value=1)
+        self.dc.init(self.dc.OUT, value=1)
+        self.rst.init(self.rst.OUT, value=1)
+        self.busy.init(self.busy.IN, value=0)
+
+        # Scratch buffers reused by every command so the SPI layer never
+        # allocates. _params[n] is a view of the first n parameter bytes.
+        self._cbuf = bytearray(1)
+        self._pbuf = bytearray(4)
+        self._pattern = bytearray(self.FILL_CHUNK)     # See _fill()
+        self._pattern_value = 0
+        mv = memoryview(self._pbuf)
+        self._params = tuple(mv[:n] for n in range(len(self._pbuf) + 1))
+
+
+    def _init_bus(self):
         self.spi = SPI(1,
             baudrate=4_000_000,
             sck=Pin(self.SCK_PIN),
@@ -109,31 +191,75 @@ class SSD1683(framebuf.FrameBuffer):
             polarity=0,
             phase=0,
             firstbit=SPI.MSB)
-
         self.spi.init()
-        self.cs.init(self.cs.OUT, value=1)
-        self.dc.init(self.dc.OUT, value=1)
-        self.rst.init(self.rst.OUT, value=1)
-        self.busy.init(self.busy.IN, value=0)
 
 
-    def _cmd(self, command, data=None):
-        '''command and optional 1 byte of data'''
+    def _read(self, command, n):
+        '''Send command and read n (<= 4) bytes back.
+
+        The panel shares one SDA line for both directions and the SPI bus
+        has no MISO, so the reply is bit-banged on the SCK/MOSI pins and
+        the bus is re-initialised afterwards.
+        Returns a view of the scratch buffer, valid until the next command.
+        '''
+        self._cbuf[0] = command
+        self.dc(0)
+        self.cs(0)
+        self.spi.write(self._cbuf)
+        self.spi.deinit()
+        sck = Pin(self.SCK_PIN, Pin.OUT, value=0)
+        sda = Pin(self.MOSI_PIN, Pin.IN)
+        self.dc(1)
+        for i in range(n):
+            v = 0
+            for _ in range(8):
+                sck(1)
+                v = (v << 1) | sda.value()
+                sck(0)
+            self._pbuf[i] = v
         self.cs(1)
+        self._init_bus()
+        return self._params[n]
+
+
+    def _write(self, command, params=None):
+        '''command byte followed by optional parameter buffer, CS held low for both'''
+        self._cbuf[0] = command
         self.dc(0)
         self.cs(0)
-        self.spi.write(bytearray([command]))
+        self.spi.write(self._cbuf)
+        if params:
+            self.dc(1)
+            self.spi.write(params)
         self.cs(1)
-        if data is not None:
-            self._data(data)
+
+
+    def _cmd(self, command, data=None):
+        '''command and optional 1 byte of data'''
+        if data is None:
+            self._write(command)
+        else:
+            self._pbuf[0] = data
+            self._write(command, self._params[1])
+
+
+    def _cmd_n(self, command, n):
+        '''command with the first n bytes of self._pbuf as parameters'''
+        self._write(command, self._params[n])
+
+
+    def _cmd_seq(self, seq):
+        '''Send a command table built by _compile()'''
+        for command, params in seq:
+            self._write(command, params)
 
 
     def _data(self, data):
         '''one byte of data'''
-        self.cs(1)
+        self._pbuf[0] = data
         self.dc(1)
         self.cs(0)
-        self.spi.write(bytearray([data]))
+        self.spi.write(self._params[1])
         self.cs(1)
     
 
@@ -142,11 +268,60 @@ class SSD1683(framebuf.FrameBuffer):
         self.cs(1)
         self.dc(1)
         self.cs(0)
-        self.spi.write(pack('B'*len(data), *data))
+        self.spi.write(data)
+        self.cs(1)
+
+
+    def _fill(self, command, value, count):
+        '''Send command followed by count bytes of value, CS held low.
+
+        Repeats a small pattern buffer instead of building a count sized
+        bytes object.
+        '''
+        pat = self._pattern
+        if self._pattern_value != value:
+            for i in range(len(pat)):
+                pat[i] = value
+            self._pattern_value = value
+        self._cbuf[0] = command
+        self.dc(0)
+        self.cs(0)
+        self.spi.write(self._cbuf)
+        self.dc(1)
+        full, rest = divmod(count, len(pat))
+        for _ in range(full):
+            self.spi.write(pat)
+        if rest:
+            self.spi.write(memoryview(pat)[:rest])
+        self.cs(1)
+
+
+    def _stream(self, command, mv, offset, width, stride, rows):
+        '''Send command followed by `rows` slices of `width` bytes taken
+        every `stride` bytes of memoryview `mv`, starting at `offset`.
+
+        CS is held low for the whole block so the controller sees a single
+        RAM write; slices are views, nothing is copied.
+        Returns number of bytes put on the wire.
+        '''
+        self._cbuf[0] = command
+        self.dc(0)
+        self.cs(0)
+        write = self.spi.write
+        write(self._cbuf)
+        self.dc(1)
+        for start in range(offset, offset + stride * rows, stride):
+            write(mv[start:start + width])
         self.cs(1)
+        return 1 + width * rows
 
 
     def _init_buffer(self, w, h, rotation):
+        '''Allocate the drawing buffer in logical (rotated) coordinates.
+
+        For ROTATION_90 and ROTATION_270 width and height are swapped, the
+        driver turns the frame back while sending it.
+        '''
         self._rotation = rotation
         size = w * h // 8
         self.buffer = bytearray(size)
@@ -155,15 +330,64 @@ class SSD1683(framebuf.FrameBuffer):
             self.width = w
             self.height = h
         else:
-            self.width = w
-            self.height = h
-        super().__init__(self.buffer, self.width, self.height, framebuf.MONO_HLSB)
+            self.width = h
+            self.height = w
+        self._bind(self.buffer)
         print('Buffer width:{}, height:{}, size:{}'.format(self.width, self.height, size))
 
 
-    def _wait_until_idle(self):
-        while self.busy.value() == 1:
-            sleep_ms(10)
+    def _bind(self, buffer):
+        '''Make buffer the drawing target of this FrameBuffer'''
+        self.buffer = buffer
+        super().__init__(buffer, self.width, self.height, self.FB_FORMAT)
+
+
+    def _on_busy_edge(self, pin):
+        self._busy_edge = ticks_ms()
+
+
+    def _wait_until_idle(self, timeout_ms=None):
+        '''Wait for BUSY to go low and return how long it took in ms.
+
+        An IRQ on the falling edge timestamps the release. Between checks
+        the core sleeps BUSY_SLICE_MS, in light sleep if busy_lightsleep is
+        set: GPIO48 is not an RTC pin, so it cannot wake the ESP32-S3 by
+        itself and the sleep is cut in slices. Light sleep drops USB serial
+        and the Wi-Fi connection, so it is off by default; only turn it on
+        while Wi-Fi is down.
+
+        Raises
+        ------
+        OSError
+            BUSY still high after timeout_ms (default busy_timeout_ms)
+        '''
+        start = ticks_ms()
+        if self.busy.value() == 0:
+            return 0
+        if timeout_ms is None:
+            timeout_ms = self.busy_timeout_ms
+        self._busy_edge = None
+        self.busy.irq(self._busy_cb, Pin.IRQ_FALLING)
+        try:
+            while self.busy.value() == 1:
+                elapsed = ticks_diff(ticks_ms(), start)
+                if elapsed >= timeout_ms:
+                    raise OSError('BUSY still high after {} ms'.format(elapsed))
+                nap = min(self.BUSY_SLICE_MS, timeout_ms - elapsed)
+                if self.busy_lightsleep:
+                    lightsleep(nap)
+                else:
+                    sleep_ms(nap)
+        finally:
+            self.busy.irq(None)
+        end = ticks_ms() if self._busy_edge is None else self._busy_edge
+        return ticks_diff(end, start)
+
+
+    def _refresh(self, seq, name):
+        '''Trigger a display update and record its duration'''
+        self._cmd_seq(seq)
+        self.refresh_ms[name] = self._wait_until_idle()
 
 
     def HW_RESET(self):
@@ -185,99 +409,122 @@ class SSD1683(framebuf.FrameBuffer):
 
 
     def FastMode1Init(self):
-        self.EPD_Init()
+        self.HW_RESET()
+        for _ in self._init_steps():
+            self._wait_until_idle()
 
-        self._cmd(self.SET_TEMP_CONTROL, 0x80)       # Read built-in temperature sensor
 
-        self._cmd(self.SET_DISP_CTRL2, 0xB1)         # Load temperature value
-        self._cmd(self.SET_MASTER_ACTIVATE)
-        self._wait_until_idle()
+    def _init_steps(self):
+        '''Register setup of FastMode1Init() after the hardware reset.
 
-        self._cmd(self.SET_TEMP_WRITE, 0x64)         # Write to temperature register
-        self._data(0x00)
+        Yields after every command that sets BUSY, the caller waits for
+        the panel before resuming: blocking here, awaiting in
+        AsyncScreen_579. Both drivers share the one sequence.
+        '''
+        self._cmd(self.SET_SW_RESET)
+        yield
+        yield from self._temperature_steps()
+        self._cmd_seq(self.SEQ_BORDER)
+        yield
 
-        self._cmd(self.SET_DISP_CTRL2, 0x91)         # Load temperature value
-        self._cmd(self.SET_MASTER_ACTIVATE)
-        self._wait_until_idle()
 
-        self._cmd(self.SET_WRITE_BORDER, 0x1)        # 0x3 | 0-ryškus 1-jokio 2-jokio
-        self._wait_until_idle()
+    def _temperature_steps(self):
+        '''Commands of read_temperature(), yielding like _init_steps()'''
+        self._cmd_seq(self.SEQ_TEMP_SENSOR)
+        yield
+        self._set_temperature(self._read(self.SET_TEMP_READ, 2))
+        self._cmd_seq(self.SEQ_TEMP_FAST)
+        yield
+
+
+    @classmethod
+    def _temperature(cls, raw):
+        '''Temperature register bytes to °C (12 bit two's complement, 1/16 °C).
+
+        None when the read is implausible: all ones or all zeros, as a
+        floating or mis-clocked SDA line gives, or outside TEMP_MIN_C to
+        TEMP_MAX_C.
+        '''
+        word = raw[0] << 8 | raw[1]
+        if word == 0xFFFF or word == 0:
+            return None
+        t = word >> 4
+        if t & 0x800:
+            t -= 0x1000
+        t /= 16
+        if not cls.TEMP_MIN_C <= t <= cls.TEMP_MAX_C:
+            return None
+        return t
+
+
+    def read_temperature(self):
+        '''Load and read the built-in temperature sensor.
+
+        Fast mode waveforms need a fixed value in the temperature register,
+        so it is written back afterwards. Result is also kept in
+        self.temperature.
+
+        Returns
+        -------
+        float: °C, 1/16 degree resolution. None if the read was rejected
+        by _temperature(), RefreshPolicy then skips its cold rule.
+        '''
+        for _ in self._temperature_steps():
+            self._wait_until_idle()
+        return self.temperature
+
+
+    def _set_temperature(self, raw):
+        '''Decode a sensor read into self.temperature, log rejected ones'''
+        self.temperature = self._temperature(raw)
+        if self.temperature is None:
+            print('Temperature read 0x{:02X}{:02X} rejected'.format(raw[0], raw[1]))
 
 
     def Display_Clear(self, count):
         '''Fill ram and altram of both chips with 0s and 1s'''
         self.SetRAMMP()
         self.SetRAMMA()
-        self._cmd(self.SET_WRITE_RAM)
-        self._data_s(b'\xFF' * count)
+        self._fill(self.SET_WRITE_RAM, 0xFF, count)
         self.SetRAMMA()
-        self._cmd(self.SET_WRITE_ALTRAM)
-        self._data_s(b'\x00' * count)
+        self._fill(self.SET_WRITE_ALTRAM, 0x00, count)
         self.SetRAMSP()
         self.SetRAMSA()
-        self._cmd(self.SET_WRITE_RAM_SLAVE)
-        self._data_s(b'\xFF' * count)
+        self._fill(self.SET_WRITE_RAM_SLAVE, 0xFF, count)
         self.SetRAMSA()
-        self._cmd(self.SET_WRITE_ALTRAM_SLAVE)
-        self._data_s(b'\x00' * count)
+        self._fill(self.SET_WRITE_ALTRAM_SLAVE, 0x00, count)
 
 
     def SetRAMMP(self):
         '''Data entry mode for ram primary'''
-        self._cmd(self.SET_DATA_MODE, 0x02)      # Data Entry mode setting; 1 –Y decrement, X increment
-        self._cmd(self.SET_RAMXPOS)              # Set Ram X- address Start / End position
-        self._data(0x31)                         # XStart, POR = 00h
-        self._data(0x00)
-        self._cmd(self.SET_RAMYPOS)              # Set Ram Y- address  Start / End position
-        self._data(0x00)
-        self._data(0x00)
-        self._data(0x0f)
-        self._data(0x01)
+        self._cmd_seq(self.SEQ_RAM_MP)
 
 
     def SetRAMMA(self):
         '''Data entry mode for altram primary'''
-        self._cmd(self.SET_RAMXCOUNT, 0x31)
-        self._cmd(self.SET_RAMYCOUNT, 0x00)
-        self._data(0x00)
+        self._cmd_seq(self.SEQ_RAM_MA)
 
 
     def SetRAMSP(self):
         '''Data entry mode for ram Slave'''
-        self._cmd(self.SET_DATA_MODE_SLAVE, 0x03)
-        self._cmd(self.SET_RAMXPOS_SLAVE)
-        self._data(0x00)
-        self._data(0x31)
-        self._cmd(self.SET_RAMYPOS_SLAVE)
-        self._data(0x00)                # Set Ram Y- address  Start / End position
-        self._data(0x00)
-        self._data(0x0f)                # YEnd L
-        self._data(0x01)
+        self._cmd_seq(self.SEQ_RAM_SP)
 
     
     def SetRAMSA(self):
         '''Data entry mode for altram Slave'''
-        self._cmd(self.SET_RAMXCOUNT_SLAVE, 0x00)
-        self._cmd(self.SET_RAMYCOUNT_SLAVE, 0x00)
-        self._data(0x00)
+        self._cmd_seq(self.SEQ_RAM_SA)
 
 
     def Update(self):
-        self._cmd(self.SET_DISP_CTRL2, 0xF7)
-        self._cmd(self.SET_MASTER_ACTIVATE)
-        self._wait_until_idle()
+        self._refresh(self.SEQ_UPDATE, 'Update')
 
 
     def PartUpdate(self):
-        self._cmd(self.SET_DISP_CTRL2, 0xDC)
-        self._cmd(self.SET_MASTER_ACTIVATE)
-        self._wait_until_idle()
+        self._refresh(self.SEQ_PART_UPDATE, 'PartUpdate')
 
 
     def FastUpdate(self):
-        self._cmd(self.SET_DISP_CTRL2, 0xC7)
-        self._cmd(self.SET_MASTER_ACTIVATE)
-        self._wait_until_idle()
+        self._refresh(self.SEQ_FAST_UPDATE, 'FastUpdate')
 
 
     def DeepSleep(self, mode=0x01):
@@ -296,6 +543,25 @@ class SSD1683(framebuf.FrameBuffer):
         sleep_ms(5)
 
 
+    def sleep(self, mode=0x01):
+        '''DeepSleep() and remember whether RAM content survives it'''
+        self.DeepSleep(mode)
+        self.asleep = True
+        self._ram_retained = mode == 0x01
+
+
+    def wake(self):
+        '''Leave deep sleep with a minimal init.
+
+        Resets clear the registers but not the RAM, so only the
+        temperature, border and data entry settings are restored.
+        '''
+        self.FastMode1Init()
+        self.SetRAMMP()
+        self.SetRAMSP()
+        self.asleep = False
+
+
     def LoadImage(self, PosX, PosY, ImgName, ImgWidth, ImgHeight):
         ''' Load image into frame buffer on predefined possition
 
@@ -335,9 +601,110 @@ class Screen_579(SSD1683):
     EPD_WIDTH = 792
     EPD_HEIGHT = 272
 
-    def __init__(self):
-        super().__init__(self.EPD_WIDTH, self.EPD_HEIGHT)
-        self.Prepare((self.EPD_WIDTH+8) * self.EPD_HEIGHT // 8)
+    # Each controller drives 400 columns (50 bytes) of a 99 byte row. The
+    # slave takes bytes 0..49, the master bytes 49..98: byte 49 sits on the
+    # seam and is sent to both (4 MSB's visible on the left, 4 LSB's on the right)
+    HALF_BYTES = const(50)
+    SEAM_BYTE = const(49)
+    # Bytes per controller RAM, including the column hidden behind the seam
+    RAM_BYTES = (EPD_WIDTH + 8) * EPD_HEIGHT // 8
+
+    # Free heap to keep after allocating the second frame buffer
+    DOUBLE_BUFFER_RESERVE = 32 * 1024
+
+    # display update per show() mode: command table, name for refresh_ms
+    UPDATES = {
+        0: (SSD1683.SEQ_UPDATE, 'Update'),
+        1: (SSD1683.SEQ_FAST_UPDATE, 'FastUpdate'),
+        2: (SSD1683.SEQ_PART_UPDATE, 'PartUpdate'),
+    }
+
+    def __init__(self, init=True, double_buffer=False, rotation=SSD1683.ROTATION_0):
+        '''init=False leaves the panel untouched, call init() before show()
+
+        double_buffer: keep a second frame buffer, see enable_double_buffer().
+        Off by default: it costs another frame of heap.
+        rotation: ROTATION_0/90/180/270, clockwise. Drawing uses logical
+        coordinates, 272x792 for ROTATION_90 and ROTATION_270.
+        '''
+        self.policy = RefreshPolicy()   # Picks the update mode, see show()
+        super().__init__(self.EPD_WIDTH, self.EPD_HEIGHT, rotation, init=init)
+        self.row_bytes = self.EPD_WIDTH // 8
+        self._band = None
+        if rotation != self.ROTATION_0:
+            # One 8 row band of the panel, filled by _rotate_band()
+            self._band = bytearray(8 * self.row_bytes)
+            self._tile_params = array('i', (0, 0, 0))  # See transpose_band()
+        # (write command, first byte of row) for each controller, in send order
+        self._halves = ((self.SET_WRITE_RAM_SLAVE, 0),
+                        (self.SET_WRITE_RAM, self.SEAM_BYTE))
+        self._alt_halves = ((self.SET_WRITE_ALTRAM_SLAVE, 0),
+                            (self.SET_WRITE_ALTRAM, self.SEAM_BYTE))
+        self.tx_bytes = 0   # Bytes on the wire during last show()
+        self.tx_us = 0      # Time spent transmitting during last show()
+        self.windows = []   # Windows sent by the last partial show()
+        # Front buffer: the frame last sent to the panel, diffed by
+        # dirty_windows(). None when single buffered.
+        self._shown = None
+        self._shown_valid = False
+        self.keep_back = True   # Copy the shown frame into the new back buffer
+        self.auto_sleep = True  # Deep sleep (RAM kept) after every show()
+        if double_buffer:
+            self.enable_double_buffer()
+        self._crc = None        # Checksum of the frame last sent to the panel
+        self.skipped = 0        # Number of show() calls skipped as unchanged
+        if init:
+            self.Prepare(self.RAM_BYTES)
+
+
+    def enable_double_buffer(self):
+        '''Allocate the front buffer. Returns False if memory is short.
+
+        Drawing always targets self.buffer (the back buffer). show() sends
+        it, then swaps: the sent frame becomes the front buffer and the old
+        front becomes the new drawing target, refilled with the sent frame
+        unless keep_back is False. With the async driver the next frame can
+        then be composed while the panel refreshes.
+
+        On SPIRAM firmware the MicroPython heap lives in PSRAM, so the
+        buffer lands there. Without DOUBLE_BUFFER_RESERVE bytes to spare
+        after allocation the driver stays single buffered: frames are still
+        checksummed, but partial updates send the whole frame.
+        '''
+        if self._shown is not None:
+            return True
+        size = len(self.buffer)
+        gc.collect()
+        if gc.mem_free() < size + self.DOUBLE_BUFFER_RESERVE:
+            print('Double buffer disabled: {} bytes free'.format(gc.mem_free()))
+            return False
+        try:
+            self._shown = bytearray(size)
+        except MemoryError:
+            print('Double buffer disabled: allocation failed')
+            return False
+        return True
+
+
+    def init(self):
+        '''Reset and initialise the panel, clear both controllers' RAM'''
+        self.FastMode1Init()
+        self.HW_RESET()
+        self.Prepare(self.RAM_BYTES)
+
+
+    def wake(self):
+        '''Leave deep sleep, clear RAM again only if it was lost'''
+        super().wake()
+        if not self._ram_retained:
+            self.Prepare(self.RAM_BYTES)
+            self._forget()
+
+
+    def _forget(self):
+        '''Panel content unknown: the next show() sends the whole frame'''
+        self._shown_valid = False
+        self._crc = None
 
 
     def Prepare(self, count):
@@ -345,21 +712,17 @@ class Screen_579(SSD1683):
         for proper start'''
         self.SetRAMMP()
         self.SetRAMMA()
-        self._cmd(self.SET_WRITE_RAM)
-        self._data_s(b'\xFF' * count)
+        self._fill(self.SET_WRITE_RAM, 0xFF, count)
         self.SetRAMMA()
-        self._cmd(self.SET_WRITE_ALTRAM)
-        self._data_s(b'\x00' * count)
+        self._fill(self.SET_WRITE_ALTRAM, 0x00, count)
         self.SetRAMSP()
         self.SetRAMSA()
-        self._cmd(self.SET_WRITE_RAM_SLAVE)
-        self._data_s(b'\xFF' * count)
+        self._fill(self.SET_WRITE_RAM_SLAVE, 0xFF, count)
         self.SetRAMSA()
-        self._cmd(self.SET_WRITE_ALTRAM_SLAVE)
-        self._data_s(b'\x00' * count)
+        self._fill(self.SET_WRITE_ALTRAM_SLAVE, 0x00, count)
 
 
-    def show(self, mode=1):
+    def show(self, mode=None, force=False):
         '''Show buffer on screen.
 
         Parameters
@@ -368,44 +731,358 @@ class Screen_579(SSD1683):
             1- Fast;
             2- Partial;
             0- Full mode. Slowest but most clear view
+            None- Let self.policy choose (Fast when policy is None)
+        force : bool, optional
+            Refresh even if the frame equals the one last shown
+
+        Returns
+        -------
+        bool
+            False if the refresh was skipped because nothing changed
 
         Raises
         ------
         ValueError
             Buffer size is not as expected according to screen dimension
+
+        In partial mode only the windows returned by dirty_windows() are
+        sent (ROTATION_0 only, rotated frames are always sent whole).
+
+        With auto_sleep the panel enters deep sleep afterwards and is
+        woken by the next show() that has something to send.
+        '''
+        crc = crc32(self.buffer)
+        if self.asleep and (force or crc != self._crc):
+            self.wake()
+        mode = self._send(mode, force, crc)
+        if mode is None:
+            return False
+        try:
+            self._refresh(*self.UPDATES.get(mode, self.UPDATES[0]))
+            self._sync_altram()
+        except BaseException:
+            # The frame may not have reached the panel: let a retry send it
+            self._forget()
+            raise
+        if self.policy is not None:
+            self.policy.record(mode)
+        if self.auto_sleep:
+            self.sleep()
+        return True
+
+
+    def _send(self, mode, force, crc):
+        '''Transmit the frame for show(), crc is crc32() of the buffer.
+
+        Returns the update mode to run, None when skipped.
         '''
         if len(self.buffer) != self.EPD_WIDTH * self.EPD_HEIGHT / 8:
             raise ValueError(f"Invalid frame buffer size. Expected {self.EPD_WIDTH * self.EPD_HEIGHT} bytes.")
 
-        # prepare file-like object to work with
-        bitmap_buffer = BytesIO(self.buffer)
+        if crc == self._crc and not force:
+            self.skipped += 1
+            return None
+
+        # Changed windows, diffed once for both the policy and the send
+        windows = None
+        if (self._shown_valid and self._shown is not None
+                and (mode == 2 or mode is None and self.policy is not None)):
+            windows = self.dirty_windows()
+        if mode is None:
+            mode = self._choose_mode(windows)
+        start = ticks_us()
+        if mode == 2 and windows is not None:
+            self.windows = windows
+            if not self.windows and not force:
+                self.skipped += 1
+                return None
+        else:
+            self.windows = []
+        # Windows cost RAM and AltRAM writes: only worth it below half a frame
+        area = self._area(self.windows)
+        if self.windows and 2 * area < len(self.buffer) and self._rotation == self.ROTATION_0:
+            self.tx_bytes = self._transmit_windows(self.buffer, self.windows)
+        else:
+            self.windows = []
+            self.tx_bytes = self._transmit(self.buffer)
+        self.tx_us = ticks_diff(ticks_us(), start)
+        self._crc = crc
+        if self._shown is not None:
+            self._swap()
+        return mode
+
+
+    def _choose_mode(self, windows):
+        '''Ask the policy for an update mode given the changed windows,
+        None when the frame cannot be diffed'''
+        if self.policy is None:
+            return 1
+        total = len(self.buffer)
+        changed = total if windows is None else self._area(windows)
+        return self.policy.choose(changed, total, self.temperature)
+
+
+    @staticmethod
+    def _area(windows):
+        '''Bytes covered by dirty_windows() windows'''
+        return sum((x1 - x0 + 1) * (y1 - y0 + 1) for x0, x1, y0, y1 in windows)
+
+
+    def _swap(self):
+        '''Sent frame becomes the front buffer, old front the drawing target'''
+        front, back = self.buffer, self._shown
+        if self.keep_back:
+            back[:] = front
+        self._shown = front
+        self._shown_valid = True
+        self._bind(back)
+
+
+    def _sync_altram(self):
+        '''Write the frame just refreshed to AltRAM.
+
+        The partial waveform only drives pixels whose RAM and AltRAM bits
+        differ, so AltRAM has to hold the frame on screen, as RAM does,
+        before the next partial update. After a windowed send only the
+        windows are rewritten.
+        '''
+        frame = self.buffer if self._shown is None else self._shown
+        start = ticks_us()
+        if self.windows:
+            sent = self._transmit_windows(frame, self.windows, alt=True)
+        else:
+            sent = self._transmit(frame, alt=True)
+        self.tx_bytes += sent
+        self.tx_us += ticks_diff(ticks_us(), start)
+
 
-        while True:
-            chunk = bitmap_buffer.read(50)
-            if not chunk: break
+    def _transmit(self, buffer, alt=False):
+        '''Stream a full frame, one RAM (AltRAM if alt) write per controller'''
+        # Partial updates leave smaller windows behind: restore full ones
+        self.SetRAMMP()
+        self.SetRAMMA()
+        self.SetRAMSP()
+        self.SetRAMSA()
+        halves = self._alt_halves if alt else self._halves
+        if self._rotation != self.ROTATION_0:
+            return self._transmit_rotated(buffer, halves)
+        mv = memoryview(buffer)
+        sent = 0
+        for command, offset in halves:
+            sent += self._stream(command, mv, offset, self.HALF_BYTES,
+                                 self.row_bytes, self.EPD_HEIGHT)
+        return sent
+
+
+    def _transmit_rotated(self, buffer, halves):
+        '''Stream a rotated frame one 8 row band at a time.
+
+        Each band is turned into panel orientation in self._band and sent
+        to both controllers. The address counters carry on from band to
+        band, so no window is reprogrammed in between.
+        '''
+        band = memoryview(self._band)
+        sent = 0
+        for k in range(self.EPD_HEIGHT // 8):
+            self._rotate_band(buffer, k)
+            for command, offset in halves:
+                sent += self._stream(command, band, offset, self.HALF_BYTES,
+                                     self.row_bytes, 8)
+        return sent
+
+
+    def _rotate_band(self, buffer, k):
+        '''Fill self._band with panel rows 8k..8k+7 of the logical frame'''
+        rb = self.row_bytes
+        if self._rotation == self.ROTATION_180:
+            # Panel row y is logical row 271 - y read backwards
+            reverse_band(buffer, self._band, len(buffer) - 1 - 8 * k * rb)
+            return
+        lrb = self.width // 8
+        p = self._tile_params
+        if self._rotation == self.ROTATION_90:
+            # Panel (x, y) = logical (y, 791 - x): tile columns run up
+            p[0] = (self.height - 1) * lrb + k
+            p[1] = -lrb
+            p[2] = 0
+        else:
+            # Panel (x, y) = logical (271 - y, x): tile columns run down,
+            # bit order within the logical byte is reversed
+            p[0] = lrb - 1 - k
+            p[1] = lrb
+            p[2] = 1
+        transpose_band(buffer, self._band, p)
 
-            self._cmd(self.SET_WRITE_RAM_SLAVE)
-            self._data_s(chunk)
 
-            # Simulate "partial data hidden" behavior (optional)
-            bitmap_buffer.seek(-1, 1)  # Not recommended for BytesIO, can cause errors
-            # on screen intersection, half of byte is invisible. On right screen- 4 MSB's, 
-            # on right- 4 LSB's. That why need to share same byte between two screens
+    def dirty_windows(self, max_windows=4, gap=8):
+        '''Compare buffer with the last shown frame at byte granularity.
 
-            # Read the next chunk (if any)
-            chunk = bitmap_buffer.read(50)
-            if not chunk: break
+        Consecutive changed rows (allowing up to `gap` unchanged rows in
+        between) are merged into bands spanning the union of their changed
+        columns. Nearest bands are merged until at most `max_windows` remain.
 
-            self._cmd(self.SET_WRITE_RAM)
-            self._data_s(chunk)
-        bitmap_buffer.close()
+        Works on the logical frame: with rotation the windows are in
+        logical coordinates and only their area is meaningful to callers.
 
-        if mode == 1:
-            self.FastUpdate()
-        elif mode == 2:
-            self.PartUpdate()
+        Returns
+        -------
+        list of (first byte, last byte, first row, last row), inclusive
+        '''
+        rb = self.width // 8
+        new = memoryview(self.buffer)
+        old = memoryview(self._shown)
+        bands = []
+        band = None
+        for row in range(self.height):
+            o = row * rb
+            if new[o:o + rb] == old[o:o + rb]:
+                continue
+            x0 = 0
+            while new[o + x0] == old[o + x0]:
+                x0 += 1
+            x1 = rb - 1
+            while new[o + x1] == old[o + x1]:
+                x1 -= 1
+            if band is not None and row - band[3] <= gap + 1:
+                band[0] = min(band[0], x0)
+                band[1] = max(band[1], x1)
+                band[3] = row
+            else:
+                band = [x0, x1, row, row]
+                bands.append(band)
+
+        while len(bands) > max_windows:
+            # Merge the pair of neighbouring bands with the smallest row gap
+            i = min(range(len(bands) - 1), key=lambda n: bands[n + 1][2] - bands[n][3])
+            a, b = bands[i], bands.pop(i + 1)
+            a[0] = min(a[0], b[0])
+            a[1] = max(a[1], b[1])
+            a[3] = b[3]
+        return [tuple(b) for b in bands]
+
+
+    def _set_window(self, slave, xs, xe, ys, ye):
+        '''Program RAM window and address counter of one controller'''
+        p = self._pbuf
+        p[0] = xs
+        p[1] = xe
+        self._cmd_n(self.SET_RAMXPOS_SLAVE if slave else self.SET_RAMXPOS, 2)
+        p[0] = ys & 0xFF
+        p[1] = ys >> 8
+        p[2] = ye & 0xFF
+        p[3] = ye >> 8
+        self._cmd_n(self.SET_RAMYPOS_SLAVE if slave else self.SET_RAMYPOS, 4)
+        self._set_counter(slave, xs, ys)
+
+
+    def _set_counter(self, slave, x, y):
+        p = self._pbuf
+        p[0] = x
+        self._cmd_n(self.SET_RAMXCOUNT_SLAVE if slave else self.SET_RAMXCOUNT, 1)
+        p[0] = y & 0xFF
+        p[1] = y >> 8
+        self._cmd_n(self.SET_RAMYCOUNT_SLAVE if slave else self.SET_RAMYCOUNT, 2)
+
+
+    def _transmit_windows(self, buffer, windows, alt=False):
+        '''Send only the given windows of buffer to RAM, AltRAM if alt.
+
+        Each window is split on the seam byte. The slave counts X up from
+        byte 0, the master counts X down from byte 49 (X = 98 - byte).
+        AltRAM still holds the shown frame (see _sync_altram()), so the
+        partial waveform only drives pixels that changed.
+        '''
+        seam = self.SEAM_BYTE
+        last = self.row_bytes - 1
+        rb = self.row_bytes
+        mv = memoryview(buffer)
+        if alt:
+            slave_ram, master_ram = self.SET_WRITE_ALTRAM_SLAVE, self.SET_WRITE_ALTRAM
+        else:
+            slave_ram, master_ram = self.SET_WRITE_RAM_SLAVE, self.SET_WRITE_RAM
+        sent = 0
+        for x0, x1, y0, y1 in windows:
+            rows = y1 - y0 + 1
+            if x0 <= seam:
+                b1 = min(x1, seam)
+                self._set_window(True, x0, b1, y0, y1)
+                sent += self._stream(slave_ram, mv, y0 * rb + x0, b1 - x0 + 1, rb, rows)
+            if x1 >= seam:
+                b0 = max(x0, seam)
+                self._set_window(False, last - b0, last - x1, y0, y1)
+                sent += self._stream(master_ram, mv, y0 * rb + b0, x1 - b0 + 1, rb, rows)
+        return sent
+
+
+class RefreshPolicy():
+    '''Choose the cheapest display update that keeps the panel clean.
+
+    Partial updates are cheapest but leave ghosting behind, Fast updates
+    redraw the whole panel with a short waveform and Full updates are the
+    slow, flashing clean-up. Rules, first match wins:
+
+    - below cold_c the short waveforms are unreliable: Full. Skipped while
+      the temperature is unknown (None, see SSD1683._temperature())
+    - no Full update yet, or the last one is max_hours old: Full
+    - changed area up to partial_ratio of the frame: Partial, or Full
+      once max_partial Partial updates have piled up since a Full one
+    - otherwise Fast
+
+    Every decision is printed and kept in self.log as
+    (time, mode, reason, changed bytes, temperature).
+    '''
+
+    FULL = const(0)
+    FAST = const(1)
+    PARTIAL = const(2)
+    NAMES = ('full', 'fast', 'partial')
+
+    def __init__(self, max_partial=6, max_hours=24, partial_ratio=0.25,
+                 cold_c=5, log_size=16):
+        self.max_partial = max_partial
+        self.max_hours = max_hours
+        self.partial_ratio = partial_ratio
+        self.cold_c = cold_c
+        self.log_size = log_size
+        self.log = []
+        self.partials = 0       # Partial updates since the last Full one
+        self.last_full = None   # time() of the last Full update
+
+
+    def choose(self, changed, total, temperature=None):
+        '''Return the update mode for a frame with `changed` of `total`
+        bytes different from what the panel shows'''
+        now = time()
+        if temperature is not None and temperature < self.cold_c:
+            mode, reason = self.FULL, 'cold'
+        elif self.last_full is None:
+            mode, reason = self.FULL, 'no full update yet'
+        elif now - self.last_full >= self.max_hours * 3600:
+            mode, reason = self.FULL, 'last full update too old'
+        elif changed <= total * self.partial_ratio:
+            if self.partials >= self.max_partial:
+                mode, reason = self.FULL, 'partial update budget used'
+            else:
+                mode, reason = self.PARTIAL, 'small change'
         else:
-            self.Update()
+            mode, reason = self.FAST, 'large change'
+        self.log.append((now, mode, reason, changed, temperature))
+        if len(self.log) > self.log_size:
+            self.log.pop(0)
+        print('Refresh {}: {} ({}/{} bytes changed, {} °C)'.format(
+            self.NAMES[mode], reason, changed, total, temperature))
+        return mode
+
+
+    def record(self, mode):
+        '''Account for an update that was actually run'''
+        if mode == self.FULL:
+            self.partials = 0
+            self.last_full = time()
+        elif mode == self.PARTIAL:
+            self.partials += 1
+        else:
+            self.partials = 0   # A Fast update redraws every pixel
 
 
 class Screen_420(SSD1683):
@@ -428,11 +1105,9 @@ class Screen_420(SSD1683):
         for proper start'''
         self.SetRAMMP()
         self.SetRAMMA()
-        self._cmd(self.SET_WRITE_RAM)
-        self._data_s(b'\xFF' * count)
+        self._fill(self.SET_WRITE_RAM, 0xFF, count)
         self.SetRAMMA()
-        self._cmd(self.SET_WRITE_ALTRAM)
-        self._data_s(b'\x00' * count)
+        self._fill(self.SET_WRITE_ALTRAM, 0x00, count)
 
 
     def show(self, mode=1):
@@ -0,0 +1,135 @@
+# asyncio variant of the CrowPanel 5.79" driver
+#
+# The blocking driver holds the only thread while the panel is BUSY: a
+# refresh takes seconds. AsyncScreen_579 yields to the event loop instead,
+# so other work (Wi-Fi teardown, flash writes) runs while the e-paper
+# waveform plays.
+#
+# Usage:
+#   screen = AsyncScreen_579()          # or AsyncScreen_579(init=False)
+#   await screen.ainit()                # when created with init=False
+#   task = asyncio.create_task(screen.show())
+#   ... other work, drawing only when double buffered ...
+#   await task
+#
+# Released under the MIT License (MIT).
+
+import asyncio
+from time import ticks_ms, ticks_diff
+from binascii import crc32
+from machine import Pin
+from CrowPanel import Screen_579
+
+
+class AsyncScreen_579(Screen_579):
+    '''Screen_579 with awaitable ainit(), awake(), show() and wait_idle().
+
+    init() and wake() are inherited and block.
+    '''
+
+    def __init__(self, init=True, double_buffer=False, rotation=Screen_579.ROTATION_0):
+        # Set by the BUSY falling edge IRQ, see _on_busy_edge()
+        self._busy_flag = asyncio.ThreadSafeFlag()
+        super().__init__(init=init, double_buffer=double_buffer, rotation=rotation)
+
+
+    def _on_busy_edge(self, pin):
+        self._busy_edge = ticks_ms()
+        self._busy_flag.set()
+
+
+    async def wait_idle(self, timeout_ms=None):
+        '''Await BUSY going low and return how long it took in ms.
+
+        Raises
+        ------
+        OSError
+            BUSY still high after timeout_ms (default busy_timeout_ms)
+        '''
+        start = ticks_ms()
+        if self.busy.value() == 0:
+            return 0
+        if timeout_ms is None:
+            timeout_ms = self.busy_timeout_ms
+        self._busy_edge = None
+        self._busy_flag.clear()
+        self.busy.irq(self._busy_cb, Pin.IRQ_FALLING)
+        try:
+            if self.busy.value() == 1:  # Edge may have passed before arming
+                await asyncio.wait_for_ms(self._busy_flag.wait(), timeout_ms)
+        except asyncio.TimeoutError:
+            raise OSError('BUSY still high after {} ms'.format(timeout_ms))
+        finally:
+            self.busy.irq(None)
+        end = ticks_ms() if self._busy_edge is None else self._busy_edge
+        return ticks_diff(end, start)
+
+
+    async def _reset(self):
+        '''Hardware reset, see HW_RESET()'''
+        await asyncio.sleep_ms(10)
+        self.rst(0)
+        await asyncio.sleep_ms(10)
+        self.rst(1)
+        await asyncio.sleep_ms(10)
+        await self.wait_idle()
+
+
+    async def ainit(self):
+        '''Awaitable equivalent of Screen_579.init()'''
+        await self._ainit_registers()
+        await self._reset()
+        self.Prepare(self.RAM_BYTES)
+
+
+    async def awake(self):
+        '''Awaitable equivalent of Screen_579.wake()'''
+        await self._ainit_registers()
+        self.SetRAMMP()
+        self.SetRAMSP()
+        self.asleep = False
+        if not self._ram_retained:
+            self.Prepare(self.RAM_BYTES)
+            self._forget()
+
+
+    async def _ainit_registers(self):
+        '''Awaitable equivalent of FastMode1Init()'''
+        await self._reset()
+        for _ in self._init_steps():
+            await self.wait_idle()
+
+
+    async def show(self, mode=None, force=False):
+        '''Awaitable equivalent of Screen_579.show().
+
+        The frame is transmitted before the first await, so the caller can
+        run blocking work while the panel refreshes. For that a sleeping
+        panel is woken with the blocking wake(), not awake(): its resets
+        take tens of ms, the refresh seconds.
+
+        Double buffered, the sent frame has become the front buffer by then
+        and self.buffer may be drawn into as soon as the task has started.
+        Single buffered, self.buffer is still the sent frame: it is written
+        to AltRAM again after the refresh (_sync_altram()), so do not draw
+        until the task is done.
+        '''
+        crc = crc32(self.buffer)
+        if self.asleep and (force or crc != self._crc):
+            self.wake()
+        mode = self._send(mode, force, crc)
+        if mode is None:
+            return False
+        seq, name = self.UPDATES.get(mode, self.UPDATES[0])
+        self._cmd_seq(seq)
+        try:
+            self.refresh_ms[name] = await self.wait_idle()
+            self._sync_altram()
+        except BaseException:
+            self._forget()
+            raise
+        if self.policy is not None:
+            self.policy.record(mode)
+        if self.auto_sleep:
+            self.sleep()
+        return True
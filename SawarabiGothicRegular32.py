@@ -848,3 +848,119 @@ def get_ch(ch):
     next_offs = doff + 2 + ((width - 1)//8 + 1) * 32
     return _mvfont[doff + 2:next_offs], 32, width
 
+# Glyph metrics added by dev/fonttool.py
+# 4 bytes per glyph: ink left, right, top, bottom; right and bottom
+# exclusive, all 0 for a blank glyph. Entry 0 is the default glyph,
+# entry n + 1 the glyph of _sparse entry n.
+_metrics =\
+b'\x02\x10\x04\x1a\x00\x00\x00\x00\x02\x15\x04\x1a\x03\x0b\x04\x20'\
+b'\x01\x09\x04\x20\x03\x07\x17\x1f\x02\x0d\x11\x13\x03\x06\x17\x1a'\
+b'\x01\x0f\x02\x1e\x02\x0f\x04\x1a\x03\x0b\x04\x1a\x02\x0f\x04\x1a'\
+b'\x02\x0f\x04\x1a\x01\x0f\x04\x1a\x02\x0f\x04\x1a\x02\x0f\x04\x1a'\
+b'\x02\x0f\x04\x1a\x01\x0f\x04\x1a\x02\x0f\x04\x1a\x03\x06\x0b\x1a'\
+b'\x02\x10\x04\x1a\x02\x08\x03\x09\x02\x1b\x02\x1a\x04\x18\x05\x19'\
+b'\x03\x1b\x05\x1a\x05\x18\x02\x1b\x03\x1c\x01\x1a\x06\x16\x02\x1b'\
+b'\x04\x1c\x02\x1b\x03\x1d\x01\x1b\x03\x1c\x05\x1a\x04\x1a\x04\x1a'\
+b'\x03\x1a\x03\x1a\x02\x1c\x03\x1a\x04\x1c\x02\x1b\x06\x18\x02\x1a'\
+b'\x04\x19\x04\x1b\x02\x1b\x02\x1a\x05\x1a\x01\x1b\x03\x1b\x03\x1a'\
+b'\x03\x1b\x06\x18\x07\x17\x03\x1b\x01\x1c\x0e\x10\x02\x1c\x01\x1a'\
+b'\x02\x1b\x01\x1c\x01\x1e\x01\x1c\x03\x1c\x01\x1c\x01\x1d\x01\x1c'\
+b'\x03\x1c\x02\x1c\x01\x1d\x01\x1b\x01\x1d\x01\x1c\x04\x1b\x01\x1c'\
+b'\x01\x1d\x01\x1c\x01\x1d\x02\x1c\x01\x1c\x01\x1c\x03\x1b\x01\x1c'\
+b'\x01\x1b\x01\x1c\x01\x1b\x02\x1c\x01\x1c\x01\x1c\x01\x1c\x01\x1d'\
+b'\x02\x1d\x01\x1c\x02\x1c\x01\x1c\x05\x18\x02\x1c\x02\x1b\x01\x1c'\
+b'\x01\x1d\x02\x1b\x02\x1c\x01\x1c\x02\x1d\x00\x1c\x02\x1d\x01\x1c'\
+b'\x02\x1c\x01\x1c\x02\x1d\x01\x1d\x02\x18\x02\x1c\x02\x1c\x01\x1c'\
+b'\x01\x1c\x02\x1c\x02\x1c\x01\x1c\x01\x1d\x01\x1c\x02\x1d\x01\x1a'\
+b'\x01\x1d\x01\x1c\x01\x1c\x01\x1c\x01\x1c\x02\x1c\x00\x1c\x02\x1c'\
+b'\x01\x1e\x01\x1c\x01\x1d\x01\x1c\x01\x1c\x02\x1c\x01\x1d\x01\x1c'\
+b'\x02\x1d\x03\x1c\x02\x1d\x01\x1c\x01\x1d\x01\x1c\x02\x1c\x03\x1c'\
+b'\x02\x1c\x01\x1c\x01\x1d\x02\x1c\x01\x1d\x02\x1c\x02\x1d\x00\x1c'\
+b'\x01\x1d\x02\x1c\x02\x1c\x02\x1c\x02\x1c\x02\x1c\x01\x1d\x01\x1c'\
+b'\x02\x1d\x02\x1c\x01\x1d\x02\x1c'
+
+# Perfect hash of _sparse, see kernels.hash_index(). With h = c ^ (c >> 6)
+# and d = _hdisp[h & (len(_hdisp) - 1)], slot ((h * (2 * d + 1)) >> 3) ^ c
+# masked by len(_hslots) // 4 - 1 holds char code c and its _sparse entry
+# number; unused slots entry 0.
+_hdisp =\
+b'\x00\x01\x00\x00\x02\x01\x00\x01\x01\x00\x01\x00\x00\x00\x04\x00'\
+b'\x00\x00\x00\x00\x01\x01\x04\x00\x00\x00\x01\x05\x06\x00\x01\x01'\
+b'\x04\x00\x00\x00\x01\x01\x03\x02\x03\x02\x00\x01\x00\x01\x01\x00'\
+b'\x00\x00\x00\x08\x07\x00\x01\x03\x01\x02\x06\x06\x00\x00\x05\x00'
+
+_hslots =\
+b'\x89\x30\x22\x00\x20\x00\x00\x00\x8b\x30\x23\x00\x20\x00\x00\x00'\
+b'\x20\x00\x00\x00\xb4\x66\x43\x00\x0e\x66\x3e\x00\x37\x00\x0f\x00'\
+b'\x80\x30\x21\x00\x48\x53\x2e\x00\x2d\x4e\x2b\x00\x28\x00\x02\x00'\
+b'\x74\x66\x42\x00\x20\x00\x00\x00\x7a\x76\x51\x00\x42\x66\x40\x00'\
+b'\x20\x00\x00\x00\x03\x21\x15\x00\x20\x00\x00\x00\xb8\x5c\x37\x00'\
+b'\xe8\x96\x5b\x00\x74\x5e\x39\x00\x20\x00\x00\x00\x69\x66\x41\x00'\
+b'\x92\x30\x25\x00\x20\x00\x00\x00\x39\x00\x11\x00\x15\x59\x32\x00'\
+b'\x20\x00\x00\x00\x85\x51\x2d\x00\xbf\x6c\x4d\x00\x17\x6c\x4b\x00'\
+b'\x20\x00\x00\x00\x68\x88\x55\x00\x36\x00\x0e\x00\xa8\x98\x60\x00'\
+b'\x20\x00\x00\x00\xa8\x30\x27\x00\xb0\x00\x14\x00\xf0\x53\x2f\x00'\
+b'\x25\x00\x01\x00\x2c\x00\x04\x00\x2f\x00\x07\x00\x61\x8c\x57\x00'\
+b'\x71\x67\x48\x00\x38\x00\x10\x00\x6f\x30\x1f\x00\x27\x59\x34\x00'\
+b'\x29\x00\x03\x00\x1c\x59\x33\x00\xc7\x66\x44\x00\x35\x00\x0d\x00'\
+b'\x32\x00\x0a\x00\x00\x4e\x29\x00\x30\x00\x08\x00\x31\x00\x09\x00'\
+b'\x3f\x00\x13\x00\x28\x67\x47\x00\x20\x00\x00\x00\x62\x6b\x4a\x00'\
+b'\xb9\x65\x3c\x00\x2d\x00\x05\x00\x7f\x89\x56\x00\x2e\x00\x06\x00'\
+b'\x27\x97\x5e\x00\x20\x00\x00\x00\x20\x00\x00\x00\x51\x30\x1b\x00'\
+b'\x20\x00\x00\x00\x20\x00\x00\x00\x34\x6c\x4c\x00\x20\x00\x00\x00'\
+b'\xdd\x5d\x38\x00\x20\x00\x00\x00\x4d\x96\x5a\x00\x20\x00\x00\x00'\
+b'\x05\x30\x16\x00\x5c\x6d\x4e\x00\xa2\x30\x26\x00\x03\x98\x5f\x00'\
+b'\x4f\x30\x1a\x00\x71\x5c\x36\x00\x8c\x5f\x3b\x00\x20\x00\x00\x00'\
+b'\x20\x00\x00\x00\x34\x00\x0c\x00\x0c\x77\x52\x00\x1f\x57\x30\x00'\
+b'\x48\x59\x35\x00\xd1\x91\x59\x00\x2a\x6a\x49\x00\x8c\x30\x24\x00'\
+b'\x20\x00\x00\x00\x20\x00\x00\x00\x6b\x70\x50\x00\x33\x00\x0b\x00'\
+b'\x20\x00\x00\x00\x3c\x66\x3f\x00\xf7\x96\x5d\x00\x20\x00\x00\x00'\
+b'\x3a\x00\x12\x00\x5e\x30\x1c\x00\x20\x00\x00\x00\x20\x00\x00\x00'\
+b'\xe8\x90\x58\x00\x3a\x79\x53\x00\x20\x00\x00\x00\xe5\x65\x3d\x00'\
+b'\x0a\x4e\x2a\x00\x1d\x67\x46\x00\x20\x00\x00\x00\x77\x6d\x4f\x00'\
+b'\x20\x00\x00\x00\x5e\x79\x54\x00\x20\x00\x00\x00\xea\x30\x28\x00'\
+b'\x46\x30\x18\x00\x44\x30\x17\x00\x67\x30\x1d\x00\x34\x4f\x2c\x00'\
+b'\x4b\x30\x19\x00\x20\x00\x00\x00\x7f\x30\x20\x00\x6e\x30\x1e\x00'\
+b'\xea\x96\x5c\x00\x30\x57\x31\x00\x37\x5f\x3a\x00\x08\x67\x45\x00'
+
+_mvmet = memoryview(_metrics)
+
+try:
+    from kernels import hash_index as _hash_index
+except ImportError:
+    def _hash_index(disp, slots, val):
+        h = val ^ (val >> 6)
+        d = disp[h & (len(disp) - 1)]
+        i = ((((h * (2 * d + 1)) >> 3) ^ val) & ((len(slots) >> 2) - 1)) << 2
+        if slots[i] | (slots[i + 1] << 8) == val:
+            return slots[i + 2] | (slots[i + 3] << 8)
+        return -1
+
+def _index(lst, val):
+    return _hash_index(_hdisp, _hslots, val)
+
+def bs(lst, val):
+    m = _hash_index(_hdisp, _hslots, val)
+    return ifb(lst[(m << 2) + 2:]) if m >= 0 else 0
+
+def get_metrics(ch):
+    m = (_index(_mvsp, ord(ch)) + 1) << 2
+    return _mvmet[m:m + 4]
+
+CACHE_SIZE = 16
+
+# get_ch() results of the CACHE_SIZE most recently used characters
+from collections import OrderedDict
+_cache = OrderedDict()
+_get_ch = get_ch
+
+def get_ch(ch):
+    r = _cache.get(ch)
+    if r is None:
+        r = _get_ch(ch)
+        if len(_cache) >= CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+    else:
+        del _cache[ch]  # Move to most recently used end
+    _cache[ch] = r
+    return r
@@ -0,0 +1,158 @@
+# binfont.py Fonts read glyph by glyph from a file.
+#
+# A font file holds what a font_to_py module holds: a header, the _sparse
+# index, the ink bounds table of dev/fonttool.py metrics and the _font glyph
+# data. Only header, index and ink bounds are kept in RAM. Glyphs are read
+# into one reused buffer when first asked for and kept in a small LRU cache.
+# BinFont has the functions of a font module, so Writer takes it as is.
+#
+# Glyphs of packed files (F_PACKED) are stored row delta and zero run
+# encoded, see kernels.unpack_rows(), and decoded from the read buffer
+# straight into their cache entry, or the caller's buffer with get_ch_into().
+#
+# Font files are made from font modules with
+#   python3 dev/fonttool.py binary [--pack] SawarabiGothicRegular18.py ...
+#
+# Released under the MIT License (MIT).
+
+import struct
+from collections import OrderedDict
+from kernels import sparse_index, unpack_rows
+
+MAGIC = b'MPFN'
+VERSION = 2
+# magic, version, height, baseline, max_width, flags, offset shift, glyph
+# count, min_ch, max_ch; then count * 4 bytes of _sparse index, (count + 1)
+# * 4 bytes of ink bounds if F_METRICS and the glyph data to the end of the
+# file. A glyph is its width (2 bytes) and bitmap, at the offset of its
+# index entry shifted left by offset shift.
+HEADER = '<4sBBBBBBHII'
+F_HMAP = 1
+F_REVERSE = 2
+F_MONOSPACED = 4
+F_METRICS = 8
+F_PACKED = 16
+
+
+class BinFont():
+    cache_size = 32  # Default number of glyphs kept in RAM
+
+    def __init__(self, path, cache_size=None):
+        f = open(path, 'rb', 0)  # Unbuffered: reads go straight into _buf
+        try:
+            head = f.read(struct.calcsize(HEADER))
+            (magic, version, self._height, self._baseline, self._max_width,
+             flags, self._shift, count, self._min_ch, self._max_ch) = struct.unpack(HEADER, head)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('Not a font file: ' + path)
+            self._flags = flags
+            self._index = f.read(count << 2)
+            if flags & F_METRICS:
+                self._ink = memoryview(f.read((count + 1) << 2))
+                self.get_metrics = self._get_metrics
+            self._data = f.tell()
+        except Exception:
+            f.close()
+            raise
+        self._file = f
+        size = ((self._max_width + 7) >> 3) * self._height
+        if flags & F_PACKED:
+            size += size // 128 + 1  # Worst case of the encoding
+        self._buf = bytearray(2 + size)
+        self._mvbuf = memoryview(self._buf)
+        if cache_size is not None:
+            self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.reads = 0
+
+    def height(self):
+        return self._height
+
+    def baseline(self):
+        return self._baseline
+
+    def max_width(self):
+        return self._max_width
+
+    def hmap(self):
+        return bool(self._flags & F_HMAP)
+
+    def reverse(self):
+        return bool(self._flags & F_REVERSE)
+
+    def monospaced(self):
+        return bool(self._flags & F_MONOSPACED)
+
+    def min_ch(self):
+        return self._min_ch
+
+    def max_ch(self):
+        return self._max_ch
+
+    # Read the glyph of ch into _buf, return its width
+    def _read(self, ch):
+        self.reads += 1
+        index = self._index
+        m = sparse_index(index, ord(ch)) << 2
+        offset = 0 if m < 0 else (index[m + 2] | (index[m + 3] << 8)) << self._shift
+        # One read of the largest glyph size, the glyph is at the start
+        self._file.seek(self._data + offset)
+        self._file.readinto(self._mvbuf)
+        return self._buf[0] | (self._buf[1] << 8)
+
+    # Copy or decode the glyph in _buf into dst
+    def _unpack(self, dst, width):
+        size = ((width - 1) // 8 + 1) * self._height
+        if self._flags & F_PACKED:
+            unpack_rows(self._mvbuf[2:], dst, size, (width - 1) // 8 + 1)
+        else:
+            dst[:size] = self._mvbuf[2:2 + size]
+
+    # Bitmap of ch into buf, which must hold max_width() * height() bits.
+    # Returns height, width. Bypasses the cache.
+    def get_ch_into(self, ch, buf):
+        width = self._read(ch)
+        self._unpack(buf, width)
+        return self._height, width
+
+    def get_ch(self, ch):
+        cache = self._cache
+        r = cache.get(ch)
+        if r is not None:
+            self.hits += 1
+            del cache[ch]  # Move to most recently used end
+            cache[ch] = r
+            return r
+        width = self._read(ch)
+        glyph = bytearray(((width - 1) // 8 + 1) * self._height)
+        self._unpack(glyph, width)
+        r = (glyph, self._height, width)
+        # Glyphs are copied out of _buf: Writer.layout() and DrawList hold
+        # on to all glyphs of a text, which may be more than the cache.
+        if self.cache_size:
+            while len(cache) >= self.cache_size:
+                del cache[next(iter(cache))]
+            cache[ch] = r
+        return r
+
+    # Same as get_metrics() of fonts extended by dev/fonttool.py
+    def _get_metrics(self, ch):
+        m = (sparse_index(self._index, ord(ch)) + 1) << 2
+        return self._ink[m:m + 4]
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def close(self):
+        self._cache.clear()
+        self._file.close()
+
+
+# The font of module name: read from name.fnt if that file exists, else the
+# module is imported.
+def open_font(name, cache_size=None):
+    try:
+        return BinFont(name + '.fnt', cache_size)
+    except OSError:
+        return __import__(name)
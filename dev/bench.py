@@ -0,0 +1,400 @@
+# bench.py Micro benchmarks for the CrowPanel driver.
+#
+# Runs on the board (copy next to CrowPanel.py) or on a Linux box, where
+# dev/epd_sim.py stands in for the hardware. Host figures only compare
+# code paths with each other, the board is several times slower.
+#
+# Usage:
+#   python3 dev/bench.py            # all benchmarks
+#   python3 dev/bench.py rotation   # selected ones
+
+import gc
+import sys
+
+if sys.implementation.name == 'micropython':
+    from time import ticks_us, ticks_diff
+
+    ROOT = ''  # Files next to main.py
+
+    def _now():
+        return ticks_us()
+
+    def _elapsed(start):
+        return ticks_diff(ticks_us(), start)
+
+    def _heap():
+        gc.collect()
+        return gc.mem_alloc()
+else:
+    import time
+    import tracemalloc
+    import epd_sim
+    epd_sim.install()
+
+    ROOT = epd_sim.REPO + '/'
+
+    def _now():
+        return time.perf_counter()
+
+    def _elapsed(start):
+        return int((time.perf_counter() - start) * 1_000_000)
+
+    def _heap():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def timeit(fn, repeat=5):
+    '''Best of repeat runs of fn() in us'''
+    best = None
+    for _ in range(repeat):
+        start = _now()
+        fn()
+        t = _elapsed(start)
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def report(name, us, base=None):
+    if base:
+        print('{:32} {:9} us  x{:.2f}'.format(name, us, us / base))
+    else:
+        print('{:32} {:9} us'.format(name, us))
+
+
+def bench_rotation():
+    '''Full frame transmit time for each rotation'''
+    import CrowPanel
+    names = ('ROTATION_0', 'ROTATION_90', 'ROTATION_180', 'ROTATION_270')
+    base = None
+    for rotation, name in enumerate(names):
+        screen = CrowPanel.Screen_579(init=False, double_buffer=False, rotation=rotation)
+        screen.fill(0)
+        screen.fill_rect(10, 10, 100, 100, 1)
+        us = timeit(lambda: screen._transmit(screen.buffer))
+        if base is None:
+            base = us
+        report('transmit ' + name, us, base)
+
+
+def bench_layout():
+    '''Word wrap of a long forecast overview text'''
+    import CrowPanel
+    import SawarabiGothicRegular18
+    from writer import Writer
+    screen = CrowPanel.Screen_579(init=False, double_buffer=False)
+    wri = Writer(screen, SawarabiGothicRegular18)
+    text = ' '.join(['高気圧に覆われて晴れていますが、'] * 20)
+    for n in (1, 5, 20):
+        part = ' '.join(text.split(' ')[:n])
+        report('layout {:4} chars, {} lines'.format(len(part), len(wri.layout(part, 0).lines)),
+               timeit(lambda: wri.layout(part, 0)))
+
+
+# Text items of a typical forecast screen: (font size, x, y, text)
+SCREEN_TEXT = (
+    (32, 10, 28, '16日(土)'), (32, 406, 28, '17日(日)'),
+    (32, 20, 130, '晴時々曇'), (32, 416, 130, '曇一時雨'),
+    (24, 20, 64, '8/16℃'), (24, 416, 64, '9/15℃'),
+    (24, 20, 88, '0/10/20/30'), (24, 416, 88, '50/60/40/30'),
+    (18, 435, 0, '横浜地方気象台 16日 11時 発表'),
+    (18, 10, 0, '表示エリア: 神奈川県 東部'),
+) + tuple((18, 10 + 130 * p, 170, '{}日(月)'.format(18 + p)) for p in range(6)) \
+  + tuple((18, 10 + 130 * p, 252, '{}/{}℃ {}0%'.format(p, 10 + p, p)) for p in range(6))
+
+
+def bench_drawlist():
+    '''Forecast screen text, per call printstring() against a DrawList'''
+    import CrowPanel
+    import SawarabiGothicRegular18, SawarabiGothicRegular24, SawarabiGothicRegular32
+    from writer import Writer, DrawList
+    screen = CrowPanel.Screen_579(init=False, double_buffer=False)
+    fonts = {18: SawarabiGothicRegular18, 24: SawarabiGothicRegular24,
+             32: SawarabiGothicRegular32}
+
+    def writers(**kw):
+        return {size: Writer(screen, font, **kw) for size, font in fonts.items()}
+
+    def per_call(wri):
+        screen.fill(1)
+        for size, x, y, text in SCREEN_TEXT:
+            Writer.set_textpos(screen, x, y)
+            wri[size].printstring(text, True)
+
+    def batched(wri):
+        screen.fill(1)
+        dl = DrawList(screen, invert=True)
+        for size, x, y, text in SCREEN_TEXT:
+            dl.add(wri[size], x, y, text)
+        dl.draw()
+
+    if sys.implementation.name != 'micropython':
+        # The simulated blit is pure Python and would swamp the text path
+        # overhead being compared, on the board it is C: leave it out.
+        import framebuf
+        blit = framebuf.FrameBuffer.blit
+        framebuf.FrameBuffer.blit = lambda *args: None
+    try:
+        base = timeit(lambda: per_call(writers(glyph_cache_size=0, strip_budget=0)), 3)
+        report('printstring, no caches', base, base)
+        wri = writers()
+        per_call(wri)
+        report('printstring, warm caches', timeit(lambda: per_call(wri)), base)
+        report('DrawList, cold', timeit(lambda: batched(writers()), 3), base)
+        wri = writers()
+        batched(wri)
+        report('DrawList, warm glyph cache', timeit(lambda: batched(wri)), base)
+    finally:
+        if sys.implementation.name != 'micropython':
+            framebuf.FrameBuffer.blit = blit
+
+
+def bench_kernels():
+    '''Each kernel of kernels.py against its pure Python version'''
+    from array import array
+    import kernels
+    import SawarabiGothicRegular32 as font
+    glyph, height, width = font.get_ch('曇')
+    buf = bytearray(glyph)
+    bounds = bytearray(4)
+    frame = bytearray(range(256)) * 106
+    band = bytearray(8 * 99)
+    tile = array('i', (33 * 792 + 5, -34, 0))
+    chars = [ord(c) for c in '16日(土)晴時々曇神奈川県東部']
+    cases = (
+        ('invert', lambda f: f(buf, len(buf))),
+        ('ink_bounds', lambda f: f(glyph, width, height, bounds)),
+        ('bs', lambda f: [f(font._mvsp, c) for c in chars]),
+        ('sparse_index', lambda f: [f(font._mvsp, c) for c in chars]),
+        ('hash_index', lambda f: [f(font._hdisp, font._hslots, c) for c in chars]),
+        ('transpose_band', lambda f: f(frame, band, tile)),
+        ('reverse_band', lambda f: f(frame, band, len(frame) - 1)),
+    )
+    for name, run in cases:
+        base = timeit(lambda: run(kernels.fallback[name]))
+        report(name + ' python', base, base)
+        report(name + ' kernel', timeit(lambda: run(getattr(kernels, name))), base)
+
+
+def bench_lookup():
+    '''Glyph lookups per second: sparse binary search against perfect hash'''
+    import kernels
+    import SawarabiGothicRegular18 as font
+    sp = font._mvsp
+    chars = '16日(土)晴時々曇一時雨 横浜地方気象台 11時 発表 8/16℃ 0/10/20/30%'
+    codes = [ord(c) for c in chars]
+    n = len(codes)
+
+    cases = (
+        ('binary search python', lambda: [kernels.fallback['sparse_index'](sp, c) for c in codes]),
+        ('binary search kernel', lambda: [kernels.sparse_index(sp, c) for c in codes]),
+        ('perfect hash python', lambda: [kernels.fallback['hash_index'](font._hdisp, font._hslots, c)
+                                         for c in codes]),
+        ('perfect hash kernel', lambda: [font._index(sp, c) for c in codes]),
+        ('get_ch, uncached', lambda: [font._get_ch(c) for c in chars]),
+        ('get_ch, cached', lambda: [font.get_ch(c) for c in chars]),
+    )
+    base = None
+    for name, run in cases:
+        us = timeit(run, 20)
+        if base is None:
+            base = us
+        report(name, us, base)
+        print('{:32} {:9} lookups/s'.format('', n * 1000000 // max(us, 1)))
+
+
+def bench_fontmem():
+    '''Resident bytes of each font: imported module against BinFont file'''
+    import binfont
+    chars = ''.join(set(''.join(item[3] for item in SCREEN_TEXT)))
+    for size in (18, 24, 32):
+        name = 'SawarabiGothicRegular{}'.format(size)
+        # Earlier benchmarks import the fonts: measure a fresh import
+        sys.modules.pop(name, None)
+        gc.collect()
+        start = _heap()
+        font = __import__(name)
+        module = _heap() - start
+        del font
+        del sys.modules[name]
+        start = _heap()
+        font = binfont.BinFont(ROOT + name + '.fnt')
+        opened = _heap() - start
+        for char in chars:
+            font.get_ch(char)
+        used = _heap() - start
+        print('{:24} module {:6}  file {:6}  after {} glyphs {:6} bytes'.format(
+            name, module, opened, min(len(chars), font.cache_size), used))
+        font.cache_size = 0
+        report('  get_ch from file, {} chars'.format(len(chars)),
+               timeit(lambda: [font.get_ch(c) for c in chars]))
+        font.close()
+
+
+def bench_packed():
+    '''Packed .fnt glyph data: bytes saved against decode cost'''
+    import binfont
+    import kernels
+    chars = ''.join(set(''.join(item[3] for item in SCREEN_TEXT)))
+    for size in (18, 24, 32):
+        font = binfont.BinFont(ROOT + 'SawarabiGothicRegular{}.fnt'.format(size), 0)
+        if not font._flags & binfont.F_PACKED:
+            print('{} px not packed'.format(size))
+            continue
+        # Bitmap bytes of all glyphs: the unpacked data size
+        index = font._index
+        raw = 2 + len(font.get_ch('\uffff')[0])  # Default glyph
+        for i in range(0, len(index), 4):
+            raw += 2 + len(font.get_ch(chr(index[i] | (index[i + 1] << 8)))[0])
+        font._file.seek(0, 2)
+        packed = font._file.tell() - font._data
+        # Decode from RAM against copying the bitmap
+        records = []
+        for char in chars:
+            width = font._read(char)
+            glyph = font.get_ch(char)[0]
+            records.append((bytes(font._buf), glyph, (width - 1) // 8 + 1))
+        dst = bytearray(len(font._buf))
+
+        def decode():
+            for rec, glyph, stride in records:
+                kernels.unpack_rows(memoryview(rec)[2:], dst, len(glyph), stride)
+
+        def copy():
+            for rec, glyph, stride in records:
+                dst[:len(glyph)] = glyph
+
+        print('{} px glyph data {} of {} bytes, {} saved'.format(size, packed, raw, raw - packed))
+        base = timeit(copy)
+        report('  copy {} glyphs'.format(len(records)), base, base)
+        report('  decode {} glyphs'.format(len(records)), timeit(decode), base)
+        report('  get_ch_into from file', timeit(lambda: [font.get_ch_into(c, dst) for c in chars]), base)
+        font.close()
+
+
+def bench_resources():
+    '''Load time and heap of the resources main.py loads on first use'''
+    import CrowPanel
+    import resources
+    from binfont import open_font
+    from writer import Writer
+    screen = CrowPanel.Screen_579(init=False, double_buffer=False)
+    if sys.implementation.name != 'micropython':
+        # The simulated ticks are virtual and gc.mem_alloc() is 0
+        saved = resources.ticks_us, resources.ticks_diff, resources.heap_used
+        resources.ticks_us = lambda: int(time.perf_counter() * 1000000)
+        resources.ticks_diff = lambda a, b: a - b
+        resources.heap_used = _heap
+    try:
+        res = resources.Registry()
+        res.module('icons')
+        for size in (18, 24, 32):
+            name = 'SawarabiGothicRegular{}'.format(size)
+            res.add('sawarabi{}'.format(size),
+                    lambda name=name: Writer(screen, open_font(ROOT + name)),
+                    lambda wri: wri.font.close())
+        for name, *_ in res.stats():
+            res[name]
+        res.report()
+        print('{:20} {:26} us off the boot path'.format(
+            'total', sum(r[3] for r in res.stats())))
+        res.release()
+    finally:
+        if sys.implementation.name != 'micropython':
+            resources.ticks_us, resources.ticks_diff, resources.heap_used = saved
+
+
+def bench_icons():
+    '''Icons of a forecast screen: bytearray and FrameBuffer per draw
+    against IconCache'''
+    import CrowPanel
+    import framebuf
+    import icons
+    from iconcache import IconCache
+    screen = CrowPanel.Screen_579(init=False, double_buffer=False)
+    # (icon, size) drawn by create_weather_icon_large() and create_weather_icon()
+    frame = [('clear', 128), ('cloud', 64), ('cloud', 128), ('rain', 64)] \
+        + [('clear', 64), ('cloud', 32), ('rain', 64), ('snow', 32)] * 3
+    tables = {32: icons.weather_icons32, 64: icons.weather_icons64,
+              128: icons.weather_icons128}
+    copies = [0]
+
+    def per_draw():
+        for name, size in frame:
+            data = bytearray(tables[size][name])
+            copies[0] += 1
+            screen.blit(framebuf.FrameBuffer(data, size, size, framebuf.MONO_HLSB), 0, 0)
+
+    cache = IconCache(icons)
+
+    def cached():
+        for name, size in frame:
+            screen.blit(cache.get(name, size), 0, 0)
+
+    if sys.implementation.name != 'micropython':
+        blit = framebuf.FrameBuffer.blit
+        framebuf.FrameBuffer.blit = lambda *args: None
+    try:
+        base = timeit(per_draw)
+        copies[0] = 0
+        per_draw()
+        print('per draw: {} copies, {} FrameBuffers a frame'.format(copies[0], len(frame)))
+        report('  {} icons'.format(len(frame)), base, base)
+        cached()
+        print('IconCache first frame:', cache.frame_stats())
+        cached()
+        print('IconCache next frames:', cache.frame_stats())
+        report('  {} icons'.format(len(frame)), timeit(cached), base)
+    finally:
+        if sys.implementation.name != 'micropython':
+            framebuf.FrameBuffer.blit = blit
+
+
+def bench_aligned():
+    '''Glyphs at byte aligned columns: blit against direct copy'''
+    import CrowPanel
+    import SawarabiGothicRegular32
+    from writer import Writer
+    screen = CrowPanel.Screen_579(init=False, double_buffer=False)
+    wri = Writer(screen, SawarabiGothicRegular32, strip_budget=0)
+    text = '晴時々曇一時雨'
+
+    def run():
+        # One glyph per aligned column: Sawarabi advance widths are not
+        # multiples of 8, so in running text only line starts are aligned
+        for row in range(0, 240, 32):
+            for i, char in enumerate(text):
+                Writer.set_textpos(screen, 32 * i, row)
+                wri.printstring(char, True)
+
+    wri._direct = False
+    base = timeit(run)
+    report('blit', base, base)
+    wri._direct = True
+    report('direct copy', timeit(run), base)
+
+
+BENCHMARKS = {
+    'rotation': bench_rotation,
+    'layout': bench_layout,
+    'drawlist': bench_drawlist,
+    'kernels': bench_kernels,
+    'lookup': bench_lookup,
+    'fontmem': bench_fontmem,
+    'packed': bench_packed,
+    'resources': bench_resources,
+    'icons': bench_icons,
+    'aligned': bench_aligned,
+}
+
+
+def main(names=None):
+    for name in names or BENCHMARKS:
+        print('--', name)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,666 @@
+# epd_sim.py Host-side stand-ins for running CrowPanel.py under CPython.
+#
+# Installs minimal `machine`, `micropython`, `framebuf`, `ustruct` and
+# `uctypes` modules plus the MicroPython `time.ticks_*` helpers, all driven
+# by a virtual clock so panel waits complete instantly on a Linux box.
+# VirtualPanel decodes the SSD1683 command stream sent by the driver and
+# rebuilds what the 792x272 panel would show.
+#
+# Usage:
+#   import epd_sim
+#   epd_sim.install()
+#   panel = epd_sim.VirtualPanel()      # before the driver is created
+#   import CrowPanel
+#   screen = CrowPanel.Screen_579()
+#   ... draw, screen.show() ...
+#   panel.stats, panel.write_pbm('frame.pbm')
+#   epd_sim.busy_pin().hold_high(1500)   # script BUSY by hand
+#
+# Set epd_sim.heap_free to emulate a small heap (gc.mem_free()).
+
+import gc
+import os
+import struct
+import sys
+import time
+import types
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Clock():
+    '''Virtual millisecond clock. Sleeping advances it instead of blocking.'''
+
+    def __init__(self):
+        self.us = 0
+        self._pins = []
+
+    def advance_us(self, us):
+        target = self.us + max(0, int(us))
+        # Stop at every scheduled pin release so edges get exact timestamps
+        while True:
+            due = [p._release_us for p in self._pins
+                   if p._release_us is not None and p._release_us <= target]
+            if not due:
+                break
+            self.us = min(due)
+            for p in self._pins:
+                p._tick(self.us)
+        self.us = target
+
+    def ticks_ms(self):
+        return self.us // 1000
+
+    def ticks_us(self):
+        return self.us
+
+
+clock = Clock()
+_pins = {}
+bus_listeners = []  # f(cs, dc, bytes) for every SPI write, on any SPI instance
+pin_watchers = []   # f(pin, level) for every level change of any pin
+heap_free = 8 * 1024 * 1024  # Reported by gc.mem_free()
+
+
+class FakePin():
+    '''machine.Pin replacement
+
+    Output pins simply store their level. An input pin can be scripted with
+    hold_high(ms) to emulate the BUSY line of the panel controller; IRQ
+    handlers fire on the virtual edge.
+    '''
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+    WAKE_LOW = 4
+    WAKE_HIGH = 5
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 0
+        self._release_us = None
+        self._handler = None
+        self._trigger = 0
+        self.history = []  # (time_us, level)
+        old = _pins.get(id)
+        if old in clock._pins:
+            clock._pins.remove(old)
+        _pins[id] = self
+        clock._pins.append(self)
+        self.init(mode, pull, value=value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            self.mode = mode
+        if value is not None:
+            self._set(value)
+
+    def _set(self, v):
+        v = 1 if v else 0
+        if v == self._value:
+            return
+        self._value = v
+        self.history.append((clock.us, v))
+        for cb in pin_watchers:
+            cb(self, v)
+        if self._handler is None:
+            return
+        if (v == 0 and self._trigger & self.IRQ_FALLING) or (v and self._trigger & self.IRQ_RISING):
+            self._handler(self)
+
+    def _tick(self, now_us):
+        if self._release_us is not None and now_us >= self._release_us:
+            self._release_us = None
+            self._set(0)
+
+    def hold_high(self, ms):
+        '''Drive the pin high now and release it after ms of virtual time.
+        ms=None keeps it high forever (stuck BUSY).'''
+        self._set(1)
+        self._release_us = None if ms is None else clock.us + int(ms * 1000)
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._set(v)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, wake=None, hard=False):
+        self._handler = handler
+        self._trigger = trigger if handler else 0
+
+
+class FakeSPI():
+    '''machine.SPI replacement recording (dc level, bytes) for every write'''
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id=1, **kwargs):
+        self.id = id
+        self.writes = []
+        self.listeners = []
+        self.init(**kwargs)
+
+    def init(self, *args, **kwargs):
+        self.config = kwargs
+
+    def deinit(self):
+        pass
+
+    def write(self, buf):
+        data = bytes(buf)
+        dc = _pins[DC_PIN].value() if DC_PIN in _pins else 1
+        cs = _pins[CS_PIN].value() if CS_PIN in _pins else 0
+        self.writes.append((dc, data))
+        for cb in self.listeners + bus_listeners:
+            cb(cs, dc, data)
+        # 4 MHz clock: 2 us per byte
+        clock.advance_us(len(data) * 2)
+
+    def read(self, n, write=0):
+        return bytes(n)
+
+
+# Pin numbers used by CrowPanel.SSD1683. Kept here so the fakes can sample
+# them without importing the driver.
+DC_PIN = 46
+CS_PIN = 45
+BUSY_PIN = 48
+RESET_PIN = 47
+SCK_PIN = 12
+MOSI_PIN = 11
+
+
+def busy_pin():
+    return _pins[BUSY_PIN]
+
+
+def pin(id):
+    return _pins[id]
+
+
+# -- SSD1683 panel ------------------------------------------------------------
+
+class Controller():
+    '''RAM, window and address counter of one SSD1683'''
+    XBYTES = 50
+    YLINES = 300
+
+    def __init__(self):
+        self.ram = bytearray(self.XBYTES * self.YLINES)
+        self.altram = bytearray(self.XBYTES * self.YLINES)
+        self.reset()
+
+    def reset(self):
+        '''Register defaults after HW/SW reset. RAM is kept.'''
+        self.mode = 0x03
+        self.xs, self.xe = 0, self.XBYTES - 1
+        self.ys, self.ye = 0, self.YLINES - 1
+        self.x, self.y = 0, 0
+
+    def put(self, ram, v):
+        '''Store one byte and advance the address counter (entry mode
+        bits: 0 X increment, 1 Y increment; AM, bit 2, is not used by the
+        driver and not simulated)'''
+        if 0 <= self.x < self.XBYTES and 0 <= self.y < self.YLINES:
+            ram[self.y * self.XBYTES + self.x] = v
+        xstep = 1 if self.mode & 1 else -1
+        ystep = 1 if self.mode & 2 else -1
+        self.x += xstep
+        if self.x == self.xe + xstep:
+            self.x = self.xs
+            self.y += ystep
+            if self.y == self.ye + ystep:
+                self.y = self.ys
+
+
+class VirtualPanel():
+    '''Decodes the SSD1683 command stream of the CrowPanel 5.79" pair.
+
+    Commands with bit 7 set (0x91, 0xA4, 0xC4...) address the slave, which
+    shows the left half; the rest address the master. The master counts X
+    down, so buffer byte b of a row lives at master X = 98 - b. Byte 49 is
+    shared: its 4 MSB's show on the slave side, its 4 LSB's on the master.
+
+    Counts per waveform ('full', 'fast', 'partial'): refreshes and the SPI
+    bytes and commands sent since the previous refresh, in self.stats.
+    '''
+
+    WIDTH = 792
+    HEIGHT = 272
+    ROW_BYTES = WIDTH // 8
+    WAVEFORMS = {0xF7: 'full', 0xC7: 'fast', 0xDC: 'partial'}
+    BUSY_MS = {'full': 3500, 'fast': 1500, 'partial': 600}
+
+    def __init__(self, temperature=22.0):
+        self.temperature = temperature  # Returned by SET_TEMP_READ, None floats SDA
+        self.master = Controller()
+        self.slave = Controller()
+        self.frame = bytearray(b'\xFF' * (self.ROW_BYTES * self.HEIGHT))
+        self.asleep = False
+        self.refreshes = []     # (waveform, bytes, commands, time_us)
+        self.stats = {}
+        self.commands = {}      # command byte: count, over the whole run
+        self._cmd = None
+        self._args = bytearray()
+        self._ctrl2 = None
+        self._bytes = 0
+        self._ncmd = 0
+        self._reply = []        # Bits shifted out on SDA for a read
+        bus_listeners.append(self._on_write)
+        pin_watchers.append(self._on_pin)
+
+    def detach(self):
+        bus_listeners.remove(self._on_write)
+        pin_watchers.remove(self._on_pin)
+
+    def _on_pin(self, pin, level):
+        if pin.id == RESET_PIN and level == 0:
+            self.asleep = False
+            self.master.reset()
+            self.slave.reset()
+        elif pin.id == SCK_PIN and level == 1 and self._reply:
+            # 3-wire read: present the next bit on SDA at the rising edge
+            _pins[MOSI_PIN]._value = self._reply.pop(0)
+
+    def _on_write(self, cs, dc, data):
+        if cs:
+            return
+        self._bytes += len(data)
+        if self.asleep:
+            return
+        if dc == 0:
+            for c in data:
+                self._command(c)
+        else:
+            for b in data:
+                self._data(b)
+
+    def _command(self, c):
+        self._ncmd += 1
+        self.commands[c] = self.commands.get(c, 0) + 1
+        self._cmd = c
+        self._args = bytearray()
+        if c == 0x20:
+            wf = self.WAVEFORMS.get(self._ctrl2)
+            if wf:
+                self._refresh(wf)
+            else:
+                busy_pin().hold_high(10)   # Temperature load etc.
+        elif c == 0x12:
+            self.master.reset()
+            self.slave.reset()
+            busy_pin().hold_high(2)
+        elif c == 0x1B:
+            if self.temperature is None:
+                v = 0xFFFF  # No sensor answer: SDA floats high
+            else:
+                t = int(round(self.temperature * 16)) & 0xFFF
+                v = t << 4
+            self._reply = [(v >> (15 - i)) & 1 for i in range(16)]
+
+    def _data(self, b):
+        c = self._cmd
+        if c is None:
+            return
+        a = self._args
+        a.append(b)
+        ctl = self.slave if c & 0x80 else self.master
+        base = c & 0x7F
+        if base == 0x24:
+            ctl.put(ctl.ram, b)
+        elif base == 0x26:
+            ctl.put(ctl.altram, b)
+        elif base == 0x11:
+            ctl.mode = b
+        elif base == 0x44 and len(a) == 2:
+            ctl.xs, ctl.xe = a[0], a[1]
+        elif base == 0x45 and len(a) == 4:
+            ctl.ys, ctl.ye = a[0] | a[1] << 8, a[2] | a[3] << 8
+        elif base == 0x4E:
+            ctl.x = b
+        elif base == 0x4F and len(a) == 2:
+            ctl.y = a[0] | a[1] << 8
+        elif c == 0x22:
+            self._ctrl2 = b
+        elif c == 0x10:
+            self.asleep = b != 0
+
+    def compose(self, alt=False):
+        '''Frame as the controllers' RAM (AltRAM if alt) would display it,
+        MONO_HLSB'''
+        rb = self.ROW_BYTES
+        xb = Controller.XBYTES
+        if alt:
+            s, m = self.slave.altram, self.master.altram
+        else:
+            s, m = self.slave.ram, self.master.ram
+        img = bytearray(rb * self.HEIGHT)
+        for y in range(self.HEIGHT):
+            o = y * xb
+            row = y * rb
+            img[row:row + 49] = s[o:o + 49]
+            img[row + 49] = (s[o + 49] & 0xF0) | (m[o + 49] & 0x0F)
+            img[row + 50:row + rb] = bytes(reversed(m[o:o + 49]))
+        return img
+
+    def _refresh(self, waveform):
+        self.frame = self.compose()
+        self.refreshes.append((waveform, self._bytes, self._ncmd, clock.us))
+        st = self.stats.setdefault(waveform, {'refreshes': 0, 'bytes': 0, 'commands': 0})
+        st['refreshes'] += 1
+        st['bytes'] += self._bytes
+        st['commands'] += self._ncmd
+        self._bytes = 0
+        self._ncmd = 0
+        busy_pin().hold_high(self.BUSY_MS[waveform])
+
+    def write_pbm(self, path):
+        '''Save the displayed frame as a PBM image (1 = black in PBM)'''
+        with open(path, 'wb') as f:
+            f.write(b'P4\n%d %d\n' % (self.WIDTH, self.HEIGHT))
+            f.write(bytes(v ^ 0xFF for v in self.frame))
+
+
+# -- framebuf ----------------------------------------------------------------
+
+MONO_VLSB = 0
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+
+
+class FrameBuffer():
+    '''Pure Python subset of framebuf.FrameBuffer (monochrome formats only)'''
+
+    def __init__(self, buf, width, height, format, stride=None):
+        if format not in (MONO_HLSB, MONO_HMSB):
+            raise ValueError('only MONO_HLSB/MONO_HMSB are simulated')
+        self._buf = buf
+        self._w = width
+        self._h = height
+        self._fmt = format
+        stride = width if stride is None else stride
+        self._stride = (stride + 7) & ~7
+
+    def _bit(self, x):
+        return 7 - (x & 7) if self._fmt == MONO_HLSB else x & 7
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self._w and 0 <= y < self._h):
+            return None if c is None else None
+        i = (x + y * self._stride) >> 3
+        b = self._bit(x)
+        if c is None:
+            return (self._buf[i] >> b) & 1
+        if c:
+            self._buf[i] |= 1 << b
+        else:
+            self._buf[i] &= ~(1 << b) & 0xFF
+
+    def fill(self, c):
+        if self._stride == self._w and self._w % 8 == 0:
+            v = 0xFF if c else 0x00
+            n = self._stride * self._h // 8
+            self._buf[:n] = bytes([v]) * n
+        else:
+            self.fill_rect(0, 0, self._w, self._h, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(max(0, y), min(self._h, y + h)):
+            for xx in range(max(0, x), min(self._w, x + w)):
+                self.pixel(xx, yy, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for sy in range(fbuf._h):
+            dy = y + sy
+            if not 0 <= dy < self._h:
+                continue
+            for sx in range(fbuf._w):
+                dx = x + sx
+                if not 0 <= dx < self._w:
+                    continue
+                c = fbuf.pixel(sx, sy)
+                if c == key:
+                    continue
+                if palette is not None:
+                    c = palette.pixel(c, 0)
+                self.pixel(dx, dy, c)
+
+    def scroll(self, xstep, ystep):
+        old = bytes(self._buf)
+        src = FrameBuffer(bytearray(old), self._w, self._h, self._fmt, self._stride)
+        for yy in range(self._h):
+            for xx in range(self._w):
+                sx, sy = xx - xstep, yy - ystep
+                if 0 <= sx < self._w and 0 <= sy < self._h:
+                    self.pixel(xx, yy, src.pixel(sx, sy))
+
+
+# -- installation ------------------------------------------------------------
+
+def _passthrough(f):
+    return f
+
+
+def install():
+    '''Register the stand-in modules. Safe to call more than once.'''
+    if 'machine' in sys.modules and getattr(sys.modules['machine'], '_epd_sim', False):
+        return
+
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda x: x
+    micropython.native = _passthrough
+    micropython.viper = _passthrough
+    micropython.mem_info = lambda *a: None
+    sys.modules['micropython'] = micropython
+
+    machine = types.ModuleType('machine')
+    machine._epd_sim = True
+    machine.Pin = FakePin
+    machine.SPI = FakeSPI
+    machine.SLEEP = 2
+    machine.DEEPSLEEP = 4
+    machine.lightsleep = lambda ms=None: clock.advance_us((ms or 0) * 1000)
+    machine.idle = lambda: clock.advance_us(100)
+    machine.freq = lambda f=None: 240000000 if f is None else None
+    sys.modules['machine'] = machine
+
+    fb = types.ModuleType('framebuf')
+    for name in ('MONO_VLSB', 'RGB565', 'GS4_HMSB', 'MONO_HLSB', 'MONO_HMSB', 'GS2_HMSB', 'GS8'):
+        setattr(fb, name, globals()[name])
+    fb.FrameBuffer = FrameBuffer
+    sys.modules['framebuf'] = fb
+
+    sys.modules['ustruct'] = struct
+
+    uctypes = types.ModuleType('uctypes')
+
+    def _no_raw_memory(*args):
+        raise NotImplementedError('raw memory access is not simulated')
+    uctypes.addressof = _no_raw_memory
+    uctypes.bytearray_at = _no_raw_memory
+    sys.modules['uctypes'] = uctypes
+
+    # SPIRAM builds report a few MB of free heap
+    gc.mem_free = lambda: globals()["heap_free"]
+    gc.mem_alloc = lambda: 0
+
+    time.sleep_ms = lambda ms: clock.advance_us(ms * 1000)
+    time.sleep_us = lambda us: clock.advance_us(us)
+    time.ticks_ms = clock.ticks_ms
+    time.ticks_us = clock.ticks_us
+    time.ticks_cpu = clock.ticks_us
+    time.ticks_diff = lambda a, b: a - b
+    time.ticks_add = lambda a, b: a + b
+
+    if REPO not in sys.path:
+        sys.path.insert(0, REPO)
+
+
+def demo_busy(lightsleep=False):
+    '''Exercise the BUSY wait of CrowPanel without a panel, check timings'''
+    install()
+    import CrowPanel
+    screen = CrowPanel.Screen_579()
+    screen.busy_lightsleep = lightsleep
+    busy = busy_pin()
+    # The virtual clock stops at the release: the wait sees the exact edge
+    # and returns within one sleep slice
+    late_ms = screen.BUSY_SLICE_MS
+
+    busy.hold_high(1234)
+    start = clock.us
+    waited = screen._wait_until_idle()
+    print('wait measured', waited, 'ms (expected 1234)')
+    assert waited == 1234, waited
+    assert 1234 <= (clock.us - start) // 1000 <= 1234 + late_ms
+
+    busy.hold_high(None)
+    start = clock.us
+    try:
+        screen._wait_until_idle(timeout_ms=500)
+    except OSError as e:
+        print('timeout raised:', e)
+    else:
+        raise AssertionError('stuck BUSY did not time out')
+    assert 500 <= (clock.us - start) // 1000 <= 500 + late_ms
+    busy.value(0)
+    assert screen._wait_until_idle() == 0
+
+
+def demo_panel(path='frame.pbm'):
+    '''Draw, refresh in the driver's chosen modes, check the panel content
+    and report the traffic. path=None writes no image.'''
+    install()
+    panel = VirtualPanel()
+    try:
+        import CrowPanel
+        screen = CrowPanel.Screen_579(double_buffer=True)
+        screen.fill(1)
+        screen.fill_rect(20, 20, 300, 100, 0)
+        screen.show()
+        screen.fill_rect(600, 200, 40, 20, 0)
+        screen.show()
+        match = bytes(panel.frame) == bytes(screen._shown)
+        alt_match = panel.compose(alt=True) == panel.frame
+        print('match:', match)
+        print('AltRAM match:', alt_match)
+        for wf, st in panel.stats.items():
+            print('{:8} {refreshes} refreshes, {bytes} bytes, {commands} commands'.format(wf, **st))
+        assert match and alt_match
+        assert [r[0] for r in panel.refreshes] == ['full', 'partial']
+        # Bytes 75..79 of rows 200..219, to RAM and then AltRAM
+        assert screen.windows == [(75, 79, 200, 219)]
+        assert screen.tx_bytes < 4 * 5 * 20
+        if path is not None:
+            panel.write_pbm(path)
+            print('wrote', path)
+    finally:
+        panel.detach()
+
+
+# -- tests -------------------------------------------------------------------
+# Run with python3 dev/epd_sim.py, or python3 -m pytest dev/epd_sim.py
+
+def test_busy_wait():
+    '''BUSY waits measure the release edge and time out, either sleep'''
+    demo_busy(lightsleep=False)
+    demo_busy(lightsleep=True)
+
+
+def test_panel():
+    '''Panel RAM and AltRAM hold the frame after full, windowed, seam
+    crossing and rotated updates'''
+    demo_panel(path=None)
+    import CrowPanel
+    for rotation in (CrowPanel.SSD1683.ROTATION_0, CrowPanel.SSD1683.ROTATION_180):
+        panel = VirtualPanel()
+        try:
+            screen = CrowPanel.Screen_579(double_buffer=True, rotation=rotation)
+            screen.policy = None
+            screen.fill(1)
+            screen.show(mode=0)
+            # Bytes 47..52 straddle seam byte 49: both controllers are written
+            screen.fill_rect(380, 100, 40, 10, 0)
+            screen.show(mode=2)
+            if rotation == CrowPanel.SSD1683.ROTATION_0:
+                assert screen.windows == [(47, 52, 100, 109)]
+                assert panel.frame == bytes(screen._shown)
+            else:
+                assert screen.windows == []  # Rotated frames are sent whole
+                assert panel.frame == bytes(reversed([int('{:08b}'.format(b)[::-1], 2)
+                                                      for b in screen._shown]))
+            assert panel.compose(alt=True) == panel.frame
+            assert [r[0] for r in panel.refreshes] == ['full', 'partial']
+        finally:
+            panel.detach()
+
+
+def test_temperature():
+    '''Implausible sensor reads are rejected and the cold rule skipped'''
+    install()
+    import CrowPanel
+    decode = CrowPanel.SSD1683._temperature
+    assert decode(b'\x16\x00') == 22.0
+    assert decode(b'\xff\xf0') == -0.0625
+    assert decode(b'\xff\xff') is None    # Floating SDA
+    assert decode(b'\x00\x00') is None
+    assert decode(b'\x64\x00') is None    # 100 °C
+    assert decode(b'\xd0\x00') is None    # -48 °C
+
+    policy = CrowPanel.RefreshPolicy()
+    policy.record(policy.FULL)
+    assert policy.choose(10, 1000, -5) == policy.FULL
+    assert policy.choose(10, 1000, None) == policy.PARTIAL
+
+    for reading in (None, 100.0):
+        panel = VirtualPanel(temperature=reading)
+        try:
+            screen = CrowPanel.Screen_579(double_buffer=True)
+            assert screen.temperature is None
+            screen.fill(1)
+            screen.show()
+            screen.fill_rect(0, 0, 16, 16, 0)
+            screen.show()
+            assert panel.refreshes[-1][0] == 'partial'
+        finally:
+            panel.detach()
+
+
+if __name__ == '__main__':
+    demo_busy()
+    demo_panel()
+    test_busy_wait()
+    test_panel()
+    test_temperature()
+    print('tests passed')
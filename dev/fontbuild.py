@@ -0,0 +1,174 @@
+# fontbuild.py Build the Sawarabi fonts with only the glyphs one panel shows.
+#
+# main.py prints a fixed set of strings per font size plus the names of the
+# forecast office and area chosen in config.py. This collects those
+# characters from the JMA area.json, weather_config.weather_code and the
+# formats of main.py, runs font_to_py.py for each size and post-processes
+# the modules with dev/fonttool.py (metrics --hash, binary --pack).
+#
+#   python3 dev/fontbuild.py chars                 # characters per size
+#   python3 dev/fontbuild.py check                 # fonts in the project root
+#   python3 dev/fontbuild.py build --ttf SawarabiGothic-Regular.ttf \
+#       --font-to-py font_to_py.py
+#
+# Codes default to those of config.py (config.py.sample if there is none),
+# override them with --forest-code, --area-code and --temp-area-code.
+# area.json is downloaded to --area-json if the file does not exist.
+# check and build exit with status 1 if a font lacks a needed glyph.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import urllib.request
+
+import fonttool
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO)
+from weather_config import weather_code
+from forecast import WEEEKDAY
+
+AREA_URL = 'https://www.jma.go.jp/bosai/common/const/area.json'
+FONT = 'SawarabiGothicRegular{}'
+SIZES = (18, 24, 32)
+
+DIGITS = '0123456789'
+# Fixed text of main.py per font size, see screen_rendering()
+FIXED = {
+    # Week forecast dates and temps/pops, header and area line
+    18: DIGITS + ' /-%℃()日' + ''.join(WEEEKDAY) + '年月日時発表' + '表示エリア: ',
+    # Temperature and precipitation rows of the 3 day forecast
+    24: DIGITS + '/-%℃',
+    # 3 day forecast dates and weather descriptions
+    32: DIGITS + '()日' + ''.join(WEEEKDAY) + ''.join(v[2] for v in weather_code.values()),
+}
+
+
+def config_codes():
+    '''forest_code, area_code, temp_area_code of config.py'''
+    for name in ('config.py', 'config.py.sample'):
+        path = os.path.join(REPO, name)
+        if os.path.exists(path):
+            code = {}
+            with open(path, encoding='utf-8') as f:
+                exec(f.read(), code)
+            return code['forest_code'], code['area_code'], code['temp_area_code']
+    raise FileNotFoundError('config.py')
+
+
+def load_areas(path):
+    if not os.path.exists(path):
+        print('Downloading', AREA_URL)
+        urllib.request.urlretrieve(AREA_URL, path)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def area_names(areas, forest_code, area_code):
+    '''Names main.py can print for the office: office and prefecture name,
+    and the names of its areas. The area line shows the first area of the
+    forecast, which need not be area_code.'''
+    office = areas['offices'].get('{:06}'.format(int(forest_code)))
+    if office is None:
+        raise ValueError('Unknown forest_code {}'.format(forest_code))
+    area = '{:06}'.format(int(area_code))
+    if area not in office['children']:
+        raise ValueError('area_code {} is not an area of {}'.format(area_code, office['name']))
+    names = [office['officeName'], office['name']]
+    names += [areas['class10s'][code]['name'] for code in office['children']]
+    return names
+
+
+def chars_needed(areas, forest_code, area_code):
+    '''Characters each font size must have, as {size: sorted string}'''
+    names = ''.join(area_names(areas, forest_code, area_code))
+    text = dict(FIXED)
+    text[18] += names
+    return {size: ''.join(sorted(set(chars))) for size, chars in text.items()}
+
+
+def coverage(path, chars):
+    '''Characters of chars the font module at path has no glyph for. A
+    glyph without ink only counts for white space.'''
+    mod = fonttool.load(path)
+    glyphs = dict(fonttool.sparse(mod))
+    missing = []
+    for char in chars:
+        offset = glyphs.get(ord(char))
+        if offset is None or (not char.isspace()
+                              and not any(fonttool.ink_bounds(*fonttool.glyph(mod, offset)))):
+            missing.append(char)
+    return ''.join(missing)
+
+
+def check(needed, directory):
+    '''Coverage report for the fonts in directory, True if complete'''
+    ok = True
+    for size in SIZES:
+        path = os.path.join(directory, FONT.format(size) + '.py')
+        missing = coverage(path, needed[size])
+        glyphs = len(fonttool.load(path)._sparse) >> 2
+        print('{}: needs {} of {} glyphs{}'.format(
+            os.path.basename(path), len(needed[size]), glyphs,
+            ', missing ' + missing if missing else ''))
+        ok = ok and not missing
+    return ok
+
+
+def sizes(path):
+    '''Module and .fnt file bytes of a font, 0 if absent'''
+    base = os.path.splitext(path)[0]
+    return tuple(os.path.getsize(p) if os.path.exists(p) else 0
+                 for p in (base + '.py', base + '.fnt'))
+
+
+def build(needed, args):
+    report = []
+    for size in SIZES:
+        path = os.path.join(args.out, FONT.format(size) + '.py')
+        before = sizes(path)
+        subprocess.run([sys.executable, args.font_to_py, '-c', needed[size],
+                        args.ttf, str(size), path], check=True)
+        fonttool.add_metrics(path, perfect=True)
+        fonttool.write_binary(path, pack=True)
+        report.append((os.path.basename(path), len(needed[size])) + before + sizes(path))
+    print('{:28} {:>6} {:>15} {:>15}'.format('font', 'glyphs', '.py bytes', '.fnt bytes'))
+    for name, count, py0, fnt0, py1, fnt1 in report:
+        print('{:28} {:6} {:>7}>{:<7} {:>7}>{:<7}'.format(name, count, py0, py1, fnt0, fnt1))
+
+
+def main():
+    forest, area, temp = config_codes()
+    parser = argparse.ArgumentParser(description='Subset fonts for one forecast area')
+    parser.add_argument('command', choices=('chars', 'check', 'build'))
+    parser.add_argument('--forest-code', default=forest)
+    parser.add_argument('--area-code', default=area)
+    parser.add_argument('--temp-area-code', default=temp,
+                        help='temperature station; selects data only, its name is not shown')
+    parser.add_argument('--area-json', default='area.json')
+    parser.add_argument('--ttf', default='SawarabiGothic-Regular.ttf')
+    parser.add_argument('--font-to-py', default='font_to_py.py')
+    parser.add_argument('--out', default=REPO, help='font directory (default project root)')
+    args = parser.parse_args()
+
+    areas = load_areas(args.area_json)
+    try:
+        needed = chars_needed(areas, args.forest_code, args.area_code)
+    except ValueError as e:
+        parser.error(str(e))
+    print('forest_code {} area_code {} temp_area_code {}'.format(
+        args.forest_code, args.area_code, args.temp_area_code))
+    if args.command == 'chars':
+        for size in SIZES:
+            print(size, needed[size])
+        return
+    if args.command == 'build':
+        build(needed, args)
+    if not check(needed, args.out):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
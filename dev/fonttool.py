@@ -0,0 +1,347 @@
+# fonttool.py Post-processing of fonts generated by font_to_py.py
+#
+# Runs under CPython on the fonts in the project root:
+#   python3 dev/fonttool.py metrics SawarabiGothicRegular18.py ...
+#
+# metrics  Append a per glyph ink bounds table and get_metrics() to the
+#          font module. Writer uses it instead of scanning glyph bitmaps.
+#          The module also picks up the compiled bs() lookup of kernels.py.
+#          Running it again replaces the section.
+#          --hash also adds a perfect hash of the _sparse index, so glyph
+#          lookup is constant time instead of a binary search, and a small
+#          get_ch() result cache.
+# binary   Write the font to a .fnt file next to the module, for
+#          binfont.BinFont which reads glyphs from flash on demand.
+#          --pack stores glyphs row delta and zero run encoded, a third
+#          smaller for the 32 px font, see kernels.unpack_rows().
+
+import argparse
+import importlib.util
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import binfont
+
+METRICS_MARK = '# Glyph metrics added by dev/fonttool.py'
+
+
+def load(path):
+    '''Import a generated font module from its file'''
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def sparse(mod):
+    '''(char code, glyph offset) pairs of the _sparse index, in order'''
+    sp = mod._sparse
+    return [(sp[i] | sp[i + 1] << 8, (sp[i + 2] | sp[i + 3] << 8) << 3)
+            for i in range(0, len(sp), 4)]
+
+
+def glyph(mod, offset):
+    '''(bitmap, height, width) of the glyph at byte offset of _font'''
+    font = mod._font
+    width = font[offset] | font[offset + 1] << 8
+    height = mod.height()
+    size = ((width - 1) // 8 + 1) * height
+    return font[offset + 2:offset + 2 + size], height, width
+
+
+def ink_bounds(bitmap, height, width):
+    '''left, right, top, bottom of the lit pixels, right and bottom
+    exclusive. All 0 for a blank glyph.'''
+    stride = (width - 1) // 8 + 1
+    left, right, top, bottom = width, 0, height, 0
+    for row in range(height):
+        for col in range(width):
+            if bitmap[row * stride + col // 8] & (0x80 >> (col % 8)):
+                left = min(left, col)
+                right = max(right, col + 1)
+                top = min(top, row)
+                bottom = row + 1
+    if not right:
+        return 0, 0, 0, 0
+    return left, right, top, bottom
+
+
+def bytes_literal(name, data):
+    '''Python source for a bytes constant, laid out like font_to_py.py'''
+    lines = ['{} ='.format(name)]
+    for i in range(0, len(data), 16):
+        chunk = ''.join('\\x{:02x}'.format(b) for b in data[i:i + 16])
+        lines.append("b'{}'".format(chunk))
+    return '\\\n'.join(lines) + '\n'
+
+
+SEARCH_CODE = '''
+def _index(lst, val):
+    lo = 0
+    hi = len(lst) >> 2
+    while lo < hi:
+        m = (lo + hi) >> 1
+        v = ifb(lst[m << 2:])
+        if v == val:
+            return m
+        if v < val:
+            lo = m + 1
+        else:
+            hi = m
+    return -1
+
+# Compiled lookups when kernels.py is on the path
+try:
+    from kernels import bs, sparse_index as _index
+except ImportError:
+    pass
+'''
+
+HASH_CODE = '''
+try:
+    from kernels import hash_index as _hash_index
+except ImportError:
+    def _hash_index(disp, slots, val):
+        h = val ^ (val >> 6)
+        d = disp[h & (len(disp) - 1)]
+        i = ((((h * (2 * d + 1)) >> 3) ^ val) & ((len(slots) >> 2) - 1)) << 2
+        if slots[i] | (slots[i + 1] << 8) == val:
+            return slots[i + 2] | (slots[i + 3] << 8)
+        return -1
+
+def _index(lst, val):
+    return _hash_index(_hdisp, _hslots, val)
+
+def bs(lst, val):
+    m = _hash_index(_hdisp, _hslots, val)
+    return ifb(lst[(m << 2) + 2:]) if m >= 0 else 0
+'''
+
+METRICS_CODE = '''
+def get_metrics(ch):
+    m = (_index(_mvsp, ord(ch)) + 1) << 2
+    return _mvmet[m:m + 4]
+'''
+
+CACHE_CODE = '''
+# get_ch() results of the CACHE_SIZE most recently used characters
+from collections import OrderedDict
+_cache = OrderedDict()
+_get_ch = get_ch
+
+def get_ch(ch):
+    r = _cache.get(ch)
+    if r is None:
+        r = _get_ch(ch)
+        if len(_cache) >= CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+    else:
+        del _cache[ch]  # Move to most recently used end
+    _cache[ch] = r
+    return r
+'''
+
+
+def _pow2(n):
+    '''Smallest power of two >= n'''
+    p = 1
+    while p < n:
+        p <<= 1
+    return p
+
+
+def perfect_hash(codes):
+    '''Displacement and slot tables for kernels.hash_index()
+
+    Both tables have power of two sizes so lookups mask instead of taking a
+    remainder, which viper code cannot. Codes are spread over buckets by
+    the low bits of h = code ^ (code >> 6). Going from the largest bucket down, each gets the first
+    displacement d < 256 that sends all its codes to free slots; the slot
+    count doubles until every bucket finds one. A slot holds char code and
+    _sparse entry number, 2 bytes each. Unused slots repeat entry 0: a
+    lookup only matches them for its own code.
+    '''
+    def mix(code):
+        return code ^ (code >> 6)
+
+    def slot(code, d):
+        return (((mix(code) * (2 * d + 1)) >> 3) ^ code) & (count - 1)
+
+    n = len(codes)
+    buckets = _pow2(max(1, n // 2))
+    count = _pow2(n + n // 4)
+    while count <= 16 * _pow2(n):
+        groups = [[] for _ in range(buckets)]
+        for entry, code in enumerate(codes):
+            groups[mix(code) & (buckets - 1)].append((code, entry))
+        disp = bytearray(buckets)
+        slots = [None] * count
+        for b in sorted(range(buckets), key=lambda b: -len(groups[b])):
+            for d in range(256):
+                taken = {slot(code, d) for code, _ in groups[b]}
+                if len(taken) == len(groups[b]) and \
+                        all(slots[i] is None for i in taken):
+                    break
+            else:
+                break
+            disp[b] = d
+            for code, entry in groups[b]:
+                slots[slot(code, d)] = (code, entry)
+        else:
+            table = bytearray()
+            for slot in slots:
+                code, entry = slot or (codes[0], 0)
+                table += bytes((code & 0xFF, code >> 8, entry & 0xFF, entry >> 8))
+            return bytes(disp), bytes(table)
+        count <<= 1
+    raise ValueError('no perfect hash for {} codes'.format(n))
+
+
+def hash_tables(mod):
+    '''Source of the perfect hash tables of a font module'''
+    codes = [code for code, _ in sparse(mod)]
+    disp, slots = perfect_hash(codes)
+    return '\n'.join((
+        '# Perfect hash of _sparse, see kernels.hash_index(). With h = c ^ (c >> 6)',
+        '# and d = _hdisp[h & (len(_hdisp) - 1)], slot ((h * (2 * d + 1)) >> 3) ^ c',
+        '# masked by len(_hslots) // 4 - 1 holds char code c and its _sparse entry',
+        '# number; unused slots entry 0.',
+        bytes_literal('_hdisp', disp),
+        bytes_literal('_hslots', slots)))
+
+
+def metrics_source(mod, perfect=False, cache_size=16):
+    '''Source of the metrics section for a font module'''
+    table = bytearray(ink_bounds(*glyph(mod, 0)))  # Default glyph
+    for _, offset in sparse(mod):
+        table += bytes(ink_bounds(*glyph(mod, offset)))
+    parts = [
+        METRICS_MARK,
+        '# 4 bytes per glyph: ink left, right, top, bottom; right and bottom',
+        '# exclusive, all 0 for a blank glyph. Entry 0 is the default glyph,',
+        '# entry n + 1 the glyph of _sparse entry n.',
+        bytes_literal('_metrics', table)]
+    if perfect:
+        parts.append(hash_tables(mod))
+    src = '\n'.join(parts) + '\n_mvmet = memoryview(_metrics)\n'
+    src += (HASH_CODE if perfect else SEARCH_CODE) + METRICS_CODE
+    if perfect:
+        src += '\nCACHE_SIZE = {}\n'.format(cache_size) + CACHE_CODE
+    return src
+
+
+def add_metrics(path, perfect=False, cache_size=16):
+    with open(path, encoding='utf-8') as f:
+        src = f.read()
+    src = src.split('\n' + METRICS_MARK)[0].rstrip('\n') + '\n'
+    mod = load(path)
+    src += '\n' + metrics_source(mod, perfect, cache_size)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(src)
+    print('{}: metrics for {} glyphs{}'.format(
+        path, len(sparse(mod)) + 1, ', perfect hash' if perfect else ''))
+
+
+def pack_rows(bitmap, height, width):
+    '''Encoding of a glyph for kernels.unpack_rows(): each row XORed with
+    the one above, then runs of zero bytes and literal bytes of up to 128
+    behind a control byte. Single zeros go into literal runs, so a glyph
+    grows by at most one byte per 128 (binfont.BinFont's read buffer).'''
+    stride = (width - 1) // 8 + 1
+    size = stride * height
+    delta = bytes(bitmap[i] ^ bitmap[i - stride] if i >= stride else bitmap[i]
+                  for i in range(size))
+
+    def zeros(i):  # Length of the zero run at i
+        j = i
+        while j < size and j - i < 128 and not delta[j]:
+            j += 1
+        return j - i
+
+    out = bytearray()
+    i = 0
+    while i < size:
+        n = zeros(i)
+        if n > 1:
+            out.append(0x80 | (n - 1))
+            i += n
+            continue
+        j = i
+        while j < size and j - i < 128 and zeros(j) < 2:
+            j += 1
+        out.append(j - i - 1)
+        out += delta[i:j]
+        i = j
+    assert len(out) <= size + size // 128 + 1
+    return bytes(out)
+
+
+def write_binary(path, pack=False, out=None):
+    '''Write the font module at path to a binfont file, by default next to
+    it. Return the file's path.'''
+    mod = load(path)
+    flags = binfont.F_HMAP * mod.hmap() | binfont.F_REVERSE * mod.reverse() \
+        | binfont.F_MONOSPACED * mod.monospaced()
+    table = getattr(mod, '_metrics', None)
+    if table is not None:
+        flags |= binfont.F_METRICS
+    count = len(mod._sparse) >> 2
+    index = bytes(mod._sparse)
+    data = bytes(mod._font)
+    shift = 3  # font_to_py offsets
+    if pack:
+        # Records at even offsets, 16 bit offsets reach 128 KB
+        flags |= binfont.F_PACKED
+        shift = 1
+        data = bytearray()
+        index = bytearray()
+        for code, offset in [(None, 0)] + sparse(mod):
+            bitmap, height, width = glyph(mod, offset)
+            if code is not None:
+                index += struct.pack('<HH', code, len(data) >> shift)
+            data += struct.pack('<H', width) + pack_rows(bitmap, height, width)
+            data += bytes(len(data) & 1)
+        if len(data) >> shift > 0xFFFF:
+            raise ValueError('{}: too large to pack'.format(path))
+    head = struct.pack(binfont.HEADER, binfont.MAGIC, binfont.VERSION, mod.height(),
+                       mod.baseline(), mod.max_width(), flags, shift, count,
+                       mod.min_ch(), mod.max_ch())
+    out = out or os.path.splitext(path)[0] + '.fnt'
+    with open(out, 'wb') as f:
+        f.write(head)
+        f.write(index)
+        if table is not None:
+            f.write(bytes(table))
+        f.write(data)
+    print('{}: {} glyphs{}, {} bytes, {} in RAM'.format(
+        out, count + 1, ' packed' if pack else '', os.path.getsize(out),
+        len(head) + len(index) + (len(table) if table is not None else 0)))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('metrics', help='add glyph ink bounds to font modules')
+    p.add_argument('--hash', action='store_true',
+                   help='constant time glyph lookup through a perfect hash')
+    p.add_argument('--cache', type=int, default=16, metavar='N',
+                   help='get_ch() results cached with --hash (default 16)')
+    p.add_argument('fonts', nargs='+')
+    p = sub.add_parser('binary', help='write font modules to .fnt files')
+    p.add_argument('--pack', action='store_true', help='encode glyphs, see kernels.unpack_rows()')
+    p.add_argument('fonts', nargs='+')
+    args = parser.parse_args()
+    if args.command == 'metrics':
+        for path in args.fonts:
+            add_metrics(path, args.hash, args.cache)
+    elif args.command == 'binary':
+        for path in args.fonts:
+            write_binary(path, args.pack)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# iconcache.py FrameBuffers of the weather icons, built once per icon.
+#
+# The icon bitmaps of icons.py are bytes, which FrameBuffer does not take.
+# Instead of copying them into a bytearray for every draw, each icon gets
+# one FrameBuffer over its bytes through uctypes.bytearray_at(), like
+# CWriter does for glyphs. Icons are only ever blit sources, so the
+# read-only data is never written. The cache keeps the icon tables
+# referenced while its FrameBuffers exist.
+#
+# Released under the MIT License (MIT).
+
+import framebuf
+from uctypes import bytearray_at, addressof
+
+
+class IconCache():
+    def __init__(self, icons):
+        self._tables = {32: icons.weather_icons32, 64: icons.weather_icons64,
+                        128: icons.weather_icons128}
+        self._fbs = {}
+        # Counts since the last frame_stats()
+        self.hits = 0
+        self.allocs = 0  # FrameBuffers built
+        self.copies = 0  # Bitmaps copied: no bytearray_at() (dev/epd_sim.py)
+
+    # FrameBuffer of icon name at size 32, 64 or 128 px
+    def get(self, name, size):
+        key = (name, size)
+        fb = self._fbs.get(key)
+        if fb is not None:
+            self.hits += 1
+            return fb
+        data = self._tables[size][name]
+        try:
+            buf = bytearray_at(addressof(data), len(data))
+        except NotImplementedError:
+            buf = bytearray(data)
+            self.copies += 1
+        fb = self._fbs[key] = framebuf.FrameBuffer(buf, size, size, framebuf.MONO_HLSB)
+        self.allocs += 1
+        return fb
+
+    # Counts of the frame drawn since the last call, then reset
+    def frame_stats(self):
+        stats = {'hits': self.hits, 'allocs': self.allocs, 'copies': self.copies}
+        self.hits = self.allocs = self.copies = 0
+        return stats
+
+    def clear(self):
+        self._fbs.clear()
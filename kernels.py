@@ -0,0 +1,438 @@
+# kernels.py Inner loops of the display driver, Writer and fonts.
+#
+# On MicroPython the kernels are compiled with @micropython.viper. Elsewhere
+# (CPython on the host, see dev/epd_sim.py) the pure Python versions below
+# are used; they give the same results. The Python versions stay reachable
+# through `fallback` for benchmarks (dev/bench.py kernels).
+#
+# Viper functions take at most 4 arguments, kernels needing more read them
+# from an array('i').
+#
+# Released under the MIT License (MIT).
+
+import sys
+
+
+# -- Pure Python versions ------------------------------------------------------
+
+def _invert(buf, n):
+    '''Invert the first n bytes of buf in place'''
+    for i in range(n):
+        buf[i] ^= 0xFF
+
+
+def _ink_bounds(glyph, width, height, out):
+    '''Write left, right, top, bottom of the lit pixels of a MONO_HLSB
+    glyph to out[0:4]. Right and bottom are exclusive, all 0 when blank.'''
+    stride = (width + 7) >> 3
+    left, right, top, bottom = width, 0, height, 0
+    for row in range(height):
+        base = row * stride
+        for col in range(width):
+            if glyph[base + (col >> 3)] & (0x80 >> (col & 7)):
+                if col < left:
+                    left = col
+                if col >= right:
+                    right = col + 1
+                if row < top:
+                    top = row
+                bottom = row + 1
+    if not right:
+        left = top = 0
+    out[0] = left
+    out[1] = right
+    out[2] = top
+    out[3] = bottom
+
+
+def _sparse_index(lst, val):
+    '''Entry number of char code val in a font_to_py _sparse index, -1 if
+    absent. Entries are 4 bytes: char code, glyph offset (little endian).'''
+    lo = 0
+    hi = len(lst) >> 2
+    while lo < hi:
+        m = (lo + hi) >> 1
+        i = m << 2
+        v = lst[i] | (lst[i + 1] << 8)
+        if v == val:
+            return m
+        if v < val:
+            lo = m + 1
+        else:
+            hi = m
+    return -1
+
+
+def _bs(lst, val):
+    '''Glyph offset of char code val, 0 (the default glyph) if absent.
+    Drop-in for bs() of font_to_py fonts.'''
+    m = _sparse_index(lst, val)
+    if m < 0:
+        return 0
+    i = (m << 2) + 2
+    return lst[i] | (lst[i + 1] << 8)
+
+
+def _hash_index(disp, slots, val):
+    '''Entry number of char code val in a font's _sparse index through the
+    perfect hash of dev/fonttool.py, -1 if absent.
+
+    With h = val ^ (val >> 6) and d = disp[h & (len(disp) - 1)] the slot is
+    ((h * (2 * d + 1)) >> 3) ^ val masked by the number of slots less 1;
+    both sizes are powers of two. A slot holds char code and entry number.
+    '''
+    h = val ^ (val >> 6)
+    d = disp[h & (len(disp) - 1)]
+    i = ((((h * (2 * d + 1)) >> 3) ^ val) & ((len(slots) >> 2) - 1)) << 2
+    if slots[i] | (slots[i + 1] << 8) == val:
+        return slots[i + 2] | (slots[i + 3] << 8)
+    return -1
+
+
+def _put_rows(dst, src, p):
+    '''Copy a MONO_HLSB glyph into a MONO_HLSB buffer at a byte boundary.
+
+    p is (offset, dst stride, height, width, invert): glyph row r goes to
+    dst[offset + r * stride:]. Bits past width in the last byte of a row
+    keep their value in dst, invert flips the glyph bits.
+    '''
+    offset, stride, height, width, inv = p[0], p[1], p[2], p[3], p[4]
+    full = width >> 3
+    rem = width & 7
+    mask = (0xFF00 >> rem) & 0xFF
+    gstride = (width + 7) >> 3
+    s = 0
+    for r in range(height):
+        d = offset + r * stride
+        if inv:
+            for b in range(full):
+                dst[d + b] = src[s + b] ^ 0xFF
+        else:
+            dst[d:d + full] = src[s:s + full]
+        if rem:
+            v = src[s + full] ^ 0xFF if inv else src[s + full]
+            dst[d + full] = (dst[d + full] & (mask ^ 0xFF)) | (v & mask)
+        s += gstride
+
+
+def _unpack_rows(src, dst, n, stride):
+    '''Decode n bytes of a glyph packed by dev/fonttool.py binary --pack
+    from src into dst.
+
+    A control byte c is followed by c + 1 literal bytes if c < 0x80, else
+    it stands for (c & 0x7F) + 1 zero bytes. The decoded bytes are each
+    row XORed with the row above, the first row as is.
+    '''
+    i = 0
+    o = 0
+    while o < n:
+        c = src[i]
+        i += 1
+        if c & 0x80:
+            end = o + (c & 0x7F) + 1
+            while o < end:
+                dst[o] = dst[o - stride] if o >= stride else 0
+                o += 1
+        else:
+            end = o + c + 1
+            while o < end:
+                v = src[i]
+                i += 1
+                dst[o] = v ^ dst[o - stride] if o >= stride else v
+                o += 1
+
+
+_tables = None
+
+def _transpose_tables():
+    '''Lookup tables for transposing 8x8 pixel tiles, see _transpose_band()
+
+    Output byte i of a tile collects bit 7-i of all 8 input bytes. Table n
+    moves bits 7-i of a byte to bit 7 of byte slot i of a 24 bit word, for
+    the outputs 3n..3n+2, so a word stays a small int on 32 bit ports.
+    '''
+    tables = []
+    for first in (0, 3, 6):
+        count = min(3, 8 - first)
+        t = []
+        for v in range(256):
+            w = 0
+            for i in range(count):
+                if v & (0x80 >> (first + i)):
+                    w |= 0x80 << (8 * (count - 1 - i))
+            t.append(w)
+        tables.append(tuple(t))
+    return tuple(tables)
+
+
+def _transpose_band(src, out, p):
+    '''Transpose 8x8 tiles of src into the 8 rows of out.
+
+    p is (start, step, flip). Tile b takes the bytes src[start + (8b + j) *
+    step], j = 0..7; its output byte i holds bit 7-i of each, the first byte
+    in the MSB. It goes to row i of out, row 7-i when flip is set. A row of
+    out is len(out) // 8 bytes.
+    '''
+    global _tables
+    if _tables is None:
+        _tables = _transpose_tables()
+    t0, t1, t2 = _tables
+    start, step, flip = p[0], p[1], p[2]
+    rb = len(out) >> 3
+    rows = range(7 * rb, -1, -rb) if flip else range(0, 8 * rb, rb)
+    r0, r1, r2, r3, r4, r5, r6, r7 = rows
+    for b in range(rb):
+        a = c = d = 0
+        for j in range(8):
+            v = src[start]
+            start += step
+            a |= t0[v] >> j
+            c |= t1[v] >> j
+            d |= t2[v] >> j
+        out[r0 + b] = a >> 16
+        out[r1 + b] = (a >> 8) & 0xFF
+        out[r2 + b] = a & 0xFF
+        out[r3 + b] = c >> 16
+        out[r4 + b] = (c >> 8) & 0xFF
+        out[r5 + b] = c & 0xFF
+        out[r6 + b] = d >> 8
+        out[r7 + b] = d & 0xFF
+
+
+_reverse = None
+
+def _reverse_band(src, out, start):
+    '''Fill the 8 rows of out with bytes read backwards from src[start],
+    each bit reversed: a frame turned by 180 degrees.'''
+    global _reverse
+    if _reverse is None:
+        _reverse = bytearray(256)
+        for v in range(256):
+            r = 0
+            for i in range(8):
+                if v & (1 << i):
+                    r |= 0x80 >> i
+            _reverse[v] = r
+    rev = _reverse
+    for i in range(len(out)):
+        out[i] = rev[src[start - i]]
+
+
+fallback = {
+    'invert': _invert,
+    'ink_bounds': _ink_bounds,
+    'sparse_index': _sparse_index,
+    'bs': _bs,
+    'hash_index': _hash_index,
+    'transpose_band': _transpose_band,
+    'reverse_band': _reverse_band,
+    'put_rows': _put_rows,
+    'unpack_rows': _unpack_rows,
+}
+
+
+# -- Compiled versions ---------------------------------------------------------
+
+if sys.implementation.name == 'micropython':
+    import micropython
+
+    @micropython.viper
+    def invert(buf, n: int):
+        p = ptr8(buf)
+        for i in range(n):
+            p[i] = p[i] ^ 0xFF
+
+    @micropython.viper
+    def ink_bounds(glyph, width: int, height: int, out):
+        g = ptr8(glyph)
+        o = ptr8(out)
+        stride = (width + 7) >> 3
+        left = width
+        right = 0
+        top = height
+        bottom = 0
+        for row in range(height):
+            base = row * stride
+            for col in range(width):
+                if g[base + (col >> 3)] & (0x80 >> (col & 7)):
+                    if col < left:
+                        left = col
+                    if col >= right:
+                        right = col + 1
+                    if row < top:
+                        top = row
+                    bottom = row + 1
+        if right == 0:
+            left = 0
+            top = 0
+        o[0] = left
+        o[1] = right
+        o[2] = top
+        o[3] = bottom
+
+    @micropython.viper
+    def sparse_index(lst, val: int) -> int:
+        p = ptr8(lst)
+        lo = 0
+        hi = int(len(lst)) >> 2
+        while lo < hi:
+            m = (lo + hi) >> 1
+            i = m << 2
+            v = p[i] | (p[i + 1] << 8)
+            if v == val:
+                return m
+            if v < val:
+                lo = m + 1
+            else:
+                hi = m
+        return -1
+
+    @micropython.viper
+    def bs(lst, val: int) -> int:
+        p = ptr8(lst)
+        lo = 0
+        hi = int(len(lst)) >> 2
+        while lo < hi:
+            m = (lo + hi) >> 1
+            i = m << 2
+            v = p[i] | (p[i + 1] << 8)
+            if v == val:
+                return p[i + 2] | (p[i + 3] << 8)
+            if v < val:
+                lo = m + 1
+            else:
+                hi = m
+        return 0
+
+    @micropython.viper
+    def transpose_band(src, out, p):
+        s = ptr8(src)
+        o = ptr8(out)
+        q = ptr32(p)
+        start = q[0]
+        step = q[1]
+        flip = q[2]
+        rb = int(len(out)) >> 3
+        for b in range(rb):
+            t0 = 0
+            t1 = 0
+            t2 = 0
+            t3 = 0
+            t4 = 0
+            t5 = 0
+            t6 = 0
+            t7 = 0
+            for j in range(8):
+                v = s[start]
+                start += step
+                sh = 7 - j
+                t0 |= ((v >> 7) & 1) << sh
+                t1 |= ((v >> 6) & 1) << sh
+                t2 |= ((v >> 5) & 1) << sh
+                t3 |= ((v >> 4) & 1) << sh
+                t4 |= ((v >> 3) & 1) << sh
+                t5 |= ((v >> 2) & 1) << sh
+                t6 |= ((v >> 1) & 1) << sh
+                t7 |= (v & 1) << sh
+            if flip:
+                o[b] = t7
+                o[rb + b] = t6
+                o[2 * rb + b] = t5
+                o[3 * rb + b] = t4
+                o[4 * rb + b] = t3
+                o[5 * rb + b] = t2
+                o[6 * rb + b] = t1
+                o[7 * rb + b] = t0
+            else:
+                o[b] = t0
+                o[rb + b] = t1
+                o[2 * rb + b] = t2
+                o[3 * rb + b] = t3
+                o[4 * rb + b] = t4
+                o[5 * rb + b] = t5
+                o[6 * rb + b] = t6
+                o[7 * rb + b] = t7
+
+    @micropython.viper
+    def reverse_band(src, out, start: int):
+        s = ptr8(src)
+        o = ptr8(out)
+        n = int(len(out))
+        for i in range(n):
+            v = s[start - i]
+            v = ((v & 0xF0) >> 4) | ((v & 0x0F) << 4)
+            v = ((v & 0xCC) >> 2) | ((v & 0x33) << 2)
+            o[i] = ((v & 0xAA) >> 1) | ((v & 0x55) << 1)
+
+    @micropython.viper
+    def hash_index(disp, slots, val: int) -> int:
+        dp = ptr8(disp)
+        sp = ptr8(slots)
+        h = val ^ (val >> 6)
+        d = dp[h & (int(len(disp)) - 1)]
+        i = ((((h * (2 * d + 1)) >> 3) ^ val) & ((int(len(slots)) >> 2) - 1)) << 2
+        if (sp[i] | (sp[i + 1] << 8)) == val:
+            return sp[i + 2] | (sp[i + 3] << 8)
+        return -1
+
+    @micropython.viper
+    def put_rows(dst, src, p):
+        o = ptr8(dst)
+        s = ptr8(src)
+        q = ptr32(p)
+        offset = q[0]
+        stride = q[1]
+        height = q[2]
+        width = q[3]
+        inv = 0xFF if q[4] else 0
+        full = width >> 3
+        rem = width & 7
+        mask = (0xFF00 >> rem) & 0xFF
+        keep = mask ^ 0xFF
+        gstride = (width + 7) >> 3
+        g = 0
+        for r in range(height):
+            d = offset + r * stride
+            for b in range(full):
+                o[d + b] = s[g + b] ^ inv
+            if rem:
+                o[d + full] = (o[d + full] & keep) | ((s[g + full] ^ inv) & mask)
+            g += gstride
+
+    @micropython.viper
+    def unpack_rows(src, dst, n: int, stride: int):
+        s = ptr8(src)
+        d = ptr8(dst)
+        i = 0
+        o = 0
+        while o < n:
+            c = s[i]
+            i += 1
+            if c & 0x80:
+                end = o + (c & 0x7F) + 1
+                while o < end:
+                    if o >= stride:
+                        d[o] = d[o - stride]
+                    else:
+                        d[o] = 0
+                    o += 1
+            else:
+                end = o + c + 1
+                while o < end:
+                    v = s[i]
+                    i += 1
+                    if o >= stride:
+                        v ^= d[o - stride]
+                    d[o] = v
+                    o += 1
+
+else:
+    invert = _invert
+    ink_bounds = _ink_bounds
+    sparse_index = _sparse_index
+    bs = _bs
+    hash_index = _hash_index
+    transpose_band = _transpose_band
+    reverse_band = _reverse_band
+    put_rows = _put_rows
+    unpack_rows = _unpack_rows
@@ -1,15 +1,17 @@
 # CrowPanel ESP32 5.79" E-paper Display with 272*792 Resolution
 import time
 time.sleep(1)
+import asyncio
 
 import urequests
 # E-Paper display
 import CrowPanel as eink
-from writer import Writer
-import framebuf
+from CrowPanel_async import AsyncScreen_579
+from writer import Writer, DrawList
 import machine
-import SawarabiGothicRegular18, SawarabiGothicRegular24, SawarabiGothicRegular32
-from icons import weather_icons32, weather_icons64, weather_icons128
+from binfont import open_font
+from resources import Registry
+from iconcache import IconCache
 from weather_config import weather_code, weather_icon_combin
 from tools import connect_wifi, disconnect_wifi, set_time, get_now
 from forecast import get_three_forecast, get_week_forecast, parse_date
@@ -17,10 +19,28 @@ from config import forest_code, area_code, temp_area_code
 machine.freq(240000000) # High Power 240MHz
 
 # Instantiate a Screen
-screen = eink.Screen_579()
-sawarabi18 = Writer(screen, SawarabiGothicRegular18)
-sawarabi24 = Writer(screen, SawarabiGothicRegular24)
-sawarabi32 = Writer(screen, SawarabiGothicRegular32)
+# 前回表示したフレームを保持して差分だけ部分更新する(PSRAMに2枚目のバッファを確保)
+screen = AsyncScreen_579(double_buffer=True)
+# フォントとアイコンは起動時に読み込まず、描画で初めて使う時に読み込む
+# グリフとアイコンのキャッシュを次の描画でも使うため、描画後も解放しない
+# 読み込み時間とヒープ使用量はres.report()で確認
+res = Registry()
+res.module('icons')
+# アイコンのFrameBufferは描画ごとに作らず、アイコンごとに1度だけ作る
+res.add('icon_cache', lambda: IconCache(res['icons']), IconCache.clear)
+
+def release_writer(wri):
+    Writer.widths.pop(wri.font, None)
+    if hasattr(wri.font, 'close'):
+        wri.font.close()
+
+# フォントは.fntファイルがあれば必要なグリフだけ読み込む(無ければモジュールをimport)
+for size in (18, 24, 32):
+    res.add(f'sawarabi{size}',
+            lambda size=size: Writer(screen, open_font(f'SawarabiGothicRegular{size}')),
+            release_writer)
+# 画面のテキストはまとめて描画する
+draw_list = DrawList(screen, invert=True)
 
 # エラー追跡用のグローバル変数
 error_flag = False
@@ -75,40 +95,31 @@ def get_weather_icon_name(code) -> tuple:
 def create_weather_icon_large(code: int, offset = (0,0)):
     icon_name, half_icon_name, _ = get_weather_icon_name(code)
 
+    icon_cache = res['icon_cache']
+
     if icon_name:
-        size = 128
-        img_data = bytearray(weather_icons128[icon_name])
-        img_buf = framebuf.FrameBuffer(img_data, size, size, framebuf.MONO_HLSB)
-        screen.blit(img_buf, offset[0], offset[1])
+        screen.blit(icon_cache.get(icon_name, 128), offset[0], offset[1])
 
     if half_icon_name:
-        size = 64
-        img_data = bytearray(weather_icons64[half_icon_name])
-        img_buf = framebuf.FrameBuffer(img_data, size, size, framebuf.MONO_HLSB)
-        screen.blit(img_buf, 114 + offset[0], 64 + offset[1])
+        screen.blit(icon_cache.get(half_icon_name, 64), 114 + offset[0], 64 + offset[1])
 
 def create_weather_icon(code: int, offset = (0,0)):
     icon_name, half_icon_name, _ = get_weather_icon_name(code)
 
+    icon_cache = res['icon_cache']
+
     if icon_name:
-        size = 64
-        img_data = bytearray(weather_icons64[icon_name])
-        img_buf = framebuf.FrameBuffer(img_data, size, size, framebuf.MONO_HLSB)
-        screen.blit(img_buf, offset[0], offset[1])
+        screen.blit(icon_cache.get(icon_name, 64), offset[0], offset[1])
 
     if half_icon_name:
-        size = 32
-        img_data = bytearray(weather_icons32[half_icon_name])
-        img_buf = framebuf.FrameBuffer(img_data, size, size, framebuf.MONO_HLSB)
-        screen.blit(img_buf, 56 + offset[0], 26 + offset[1])
+        screen.blit(icon_cache.get(half_icon_name, 32), 56 + offset[0], 26 + offset[1])
 
 def write_forecast_sort_data(datas, day, x, y , end_symble = ""):
     if day in datas:
         sorted_items = sorted(datas[day].items())
         sorted_values = [value for _, value in sorted_items]
         text = "/".join(sorted_values)
-        Writer.set_textpos(screen, x, y)
-        sawarabi24.printstring(f"{text}{end_symble}", True)
+        draw_list.add(res['sawarabi24'], x, y, f"{text}{end_symble}")
 
 def screen_rendering(data):
 
@@ -126,13 +137,15 @@ def screen_rendering(data):
         raise Exception("There is an insufficient amount of data")
 
     screen.fill(eink.COLOR_WHITE)
+    draw_list.clear()
+    sawarabi18 = res['sawarabi18']
+    sawarabi32 = res['sawarabi32']
 
     for i in range(0,max_rows):
         _, _, day, hour, weekday = parse_date(three_forecast['times'][i])
         
         text = f"{day}日({weekday})"
-        Writer.set_textpos(screen, offset_x + col_x * i, offset_y)
-        sawarabi32.printstring(f"{text}", True)
+        draw_list.add(sawarabi32, offset_x + col_x * i, offset_y, text)
 
         # 天気アイコンはY軸のオフセットは別で設定
         desc = three_forecast['description']
@@ -141,8 +154,7 @@ def screen_rendering(data):
         
         # 天気のテキストはY軸のオフセットは別で設定
         text = weather_code[code][2]
-        Writer.set_textpos(screen, offset_x + col_x * i + 10, 120 + 10)
-        sawarabi32.printstring(f"{text}", True)
+        draw_list.add(sawarabi32, offset_x + col_x * i + 10, 120 + 10, text)
 
         write_forecast_sort_data(three_forecast['temps'], day,
                                 x = offset_x + col_x * i + 10,
@@ -165,8 +177,7 @@ def screen_rendering(data):
         p = i - min_rows
         _, _, day, _, weekday = parse_date(week_forecast['times'][i])
         text = f"{day}日({weekday})"
-        Writer.set_textpos(screen, cel_x * p + offset_x, offset_y)
-        sawarabi18.printstring(f"{text}", True)
+        draw_list.add(sawarabi18, cel_x * p + offset_x, offset_y, text)
 
         create_weather_icon(int(week_forecast['weatherCodes'][day]), (cel_x * p + offset_x + 10, offset_y + 18))
 
@@ -181,8 +192,7 @@ def screen_rendering(data):
             texts.append(pops[day] + "%")
         
         text = " ".join(texts)
-        Writer.set_textpos(screen, cel_x * p + offset_x, offset_y + 18 + 64)
-        sawarabi18.printstring(f"{text}", True)
+        draw_list.add(sawarabi18, cel_x * p + offset_x, offset_y + 18 + 64, text)
     
     # 気象台テキスト
     text = three_data['publishingOffice']
@@ -190,15 +200,24 @@ def screen_rendering(data):
     text += f" {year}年{month}月{day}日 {hour}時 発表"
 
     pos_x = int(792 * 0.55)
-    Writer.set_textpos(screen, pos_x , 0)
-    sawarabi18.printstring(f"{text}", True)
+    draw_list.add(sawarabi18, pos_x, 0, text)
 
     prefecture_name = week_data['timeSeries'][0]['areas'][0]['area']['name'] 
     areat_name = three_data['timeSeries'][0]['areas'][0]['area']['name']
-    Writer.set_textpos(screen, 10 , 0)
-    sawarabi18.printstring(f"表示エリア: {prefecture_name} {areat_name}", True)
+    draw_list.add(sawarabi18, 10, 0, f"表示エリア: {prefecture_name} {areat_name}")
+
+    # アイコンの描画後にテキストをフォントごとにまとめて描画
+    draw_list.draw()
 
-    screen.show()
+# 画面を更新し、E-Paperの書き換え中(BUSY)にWiFiの切断を済ませる
+async def show_screen():
+    task = asyncio.create_task(screen.show())
+    await asyncio.sleep_ms(0)  # スリープ中なら起こし、転送して書き換えを開始させる
+    disconnect_wifi()
+    if await task:
+        print(f"Screen transmit: {screen.tx_bytes} bytes, {screen.tx_us} us, refresh: {screen.refresh_ms}")
+    else:
+        print(f"Screen unchanged, refresh skipped ({screen.skipped} so far)")
 
 def run():
     global error_flag, error_time
@@ -210,6 +229,9 @@ def run():
             set_time()
             data = get_weather()
             screen_rendering(data)
+            res.report()
+            print(f"Icons: {res['icon_cache'].frame_stats()}")
+            asyncio.run(show_screen())
             # 正常完了時はエラーフラグをクリア
             error_flag = False
             error_time = None
@@ -219,8 +241,8 @@ def run():
         error_flag = True
         error_time = time.time()
         # 画面は更新しない
+        disconnect_wifi()  # 正常時は show_screen() で切断済み
     finally:
-        disconnect_wifi()
         machine.freq(20000000) # Low Power 20MHz
 
 # 起動時実行
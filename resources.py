@@ -0,0 +1,97 @@
+# resources.py Fonts, icons and other large objects loaded on first use.
+#
+# main.py registers each resource with a loader instead of importing it at
+# boot. The first get() runs the loader, timing it and measuring the heap it
+# took; release() drops the object again, a module is also removed from
+# sys.modules so the GC can reclaim it. report() prints the figures.
+#
+# The GC only reclaims a released module once nothing else refers to it or
+# its data: a `from module import ...` elsewhere, or an object built from
+# it, such as the IconCache holding the icon tables. Release those first,
+# or the next get() imports a second copy next to the one still alive.
+#
+#   res = Registry()
+#   res.module('icons')
+#   res.add('sawarabi18', lambda: Writer(screen, open_font('SawarabiGothicRegular18')))
+#   res['icons'].weather_icons32 ...
+#   res.release()
+#
+# Released under the MIT License (MIT).
+
+import gc
+import sys
+from time import ticks_us, ticks_diff
+
+
+def heap_used():
+    gc.collect()
+    return gc.mem_alloc()
+
+
+class Resource():
+    def __init__(self, name, load, unload=None, module=None):
+        self.name = name
+        self._load = load
+        self._unload = unload  # Called with the object on release
+        self._module = module  # Name of the module load imports
+        self.value = None
+        self.loads = 0
+        self.load_us = 0  # Time of the last load
+        self.heap = 0  # Heap taken by the last load
+        self.peak = 0  # Highest heap in use right after a load
+
+    def get(self):
+        if self.value is None:
+            before = heap_used()
+            start = ticks_us()
+            self.value = self._load()
+            self.load_us = ticks_diff(ticks_us(), start)
+            after = heap_used()
+            self.heap = after - before
+            self.peak = max(self.peak, after)
+            self.loads += 1
+        return self.value
+
+    def release(self):
+        if self.value is None:
+            return
+        if self._unload is not None:
+            self._unload(self.value)
+        self.value = None
+        if self._module is not None and self._module in sys.modules:
+            del sys.modules[self._module]
+
+
+class Registry():
+    def __init__(self):
+        self._resources = {}
+
+    def add(self, name, load, unload=None):
+        res = self._resources[name] = Resource(name, load, unload)
+        return res
+
+    # Module name, imported on first use
+    def module(self, name):
+        res = self._resources[name] = Resource(name, lambda: __import__(name), module=name)
+        return res
+
+    def __getitem__(self, name):
+        return self._resources[name].get()
+
+    def loaded(self, name):
+        return self._resources[name].value is not None
+
+    # Release the named resources, all if none are given
+    def release(self, *names):
+        for name in names or self._resources:
+            self._resources[name].release()
+        gc.collect()
+
+    def stats(self):
+        return [(r.name, r.value is not None, r.loads, r.load_us, r.heap, r.peak)
+                for r in self._resources.values()]
+
+    def report(self):
+        for name, loaded, loads, us, heap, peak in self.stats():
+            print('{:20} {:6} loads {:3} {:8} us {:7} bytes peak {:8}'.format(
+                name, 'loaded' if loaded else '-', loads, us, heap, peak))
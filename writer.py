@@ -1,6 +1,14 @@
 # writer.py Implements the Writer class.
 # Handles colour, word wrap and tab stops
 
+# V0.5.9 Oct 2026 Direct glyph copy at byte aligned columns, snap option.
+# V0.5.8 Oct 2026 Compiled invert and ink scan from kernels.py.
+# V0.5.7 Oct 2026 DrawList batch renderer.
+# V0.5.6 Oct 2026 measure() and print_aligned().
+# V0.5.5 Oct 2026 Use glyph metrics tables added by dev/fonttool.py.
+# V0.5.4 Oct 2026 Single pass layout() for word wrap and measurement.
+# V0.5.3 Oct 2026 Cache of rendered text runs, set_font().
+# V0.5.2 Oct 2026 LRU cache of ready to blit glyphs.
 # V0.5.1 Dec 2022 Support 4-bit color display drivers.
 # V0.5.0 Sep 2021 Color now requires firmware >= 1.17.
 # V0.4.3 Aug 2021 Support for fast blit to color displays (PR7682).
@@ -22,10 +30,13 @@
 
 
 import framebuf
+from array import array
+from collections import OrderedDict
 from uctypes import bytearray_at, addressof
 from sys import implementation
+from kernels import invert as _invert, ink_bounds as _ink_bounds, put_rows as _put_rows
 
-__version__ = (0, 5, 1)
+__version__ = (0, 5, 9)
 
 fast_mode = True  # Does nothing. Kept to avoid breaking code.
 
@@ -34,6 +45,18 @@ class DisplayState():
         self.text_row = 0
         self.text_col = 0
 
+# Result of Writer.layout(). Character i of the string is drawn at screen
+# column x0 + x[i] - x[start] of the line holding it.
+class Layout():
+    def __init__(self, string, glyphs, x, lines):
+        self.string = string
+        self.glyphs = glyphs  # font.get_ch() result for each character
+        self.x = x  # x[i] is the width of string[:i], len(string) + 1 entries
+        self.lines = lines  # (start, end, x0, fits) for each output line
+
+    def width(self, start=0, end=None):
+        return self.x[len(self.string) if end is None else end] - self.x[start]
+
 def _get_id(device):
     if not isinstance(device, framebuf.FrameBuffer):
         raise ValueError('Device must be derived from FrameBuffer.')
@@ -43,6 +66,9 @@ def _get_id(device):
 class Writer():
 
     state = {}  # Holds a display state for each device
+    glyph_cache_size = 96  # Default number of glyphs cached per colour
+    strip_budget = 8192  # Default bytes of rendered text runs cached
+    widths = {}  # Advance width of each char measured, per font
 
     @staticmethod
     def set_textpos(device, col=None, row=None):
@@ -60,19 +86,15 @@ class Writer():
             s.text_col = col
         return s.text_row,  s.text_col
 
-    def __init__(self, device, font, verbose=False):
+    def __init__(self, device, font, verbose=False, glyph_cache_size=None,
+                 strip_budget=None):
         self.devid = _get_id(device)
         self.device = device
         if self.devid not in Writer.state:
             Writer.state[self.devid] = DisplayState()
-        self.font = font
-        if font.height() >= device.height or font.max_width() >= device.width:
-            raise ValueError('Font too large for screen')
-        # Allow to work with reverse or normal font mapping
-        if font.hmap():
-            self.map = framebuf.MONO_HMSB if font.reverse() else framebuf.MONO_HLSB
-        else:
-            raise ValueError('Font must be horizontally mapped.')
+        self._glyphs = (OrderedDict(), OrderedDict())
+        self._strips = OrderedDict()
+        self._set_font(font)
         if verbose:
             fstr = 'Orientation: Horizontal. Reversal: {}. Width: {}. Height: {}.'
             print(fstr.format(font.reverse(), device.width, device.height))
@@ -86,15 +108,66 @@ class Writer():
         self.wrap = True  # Word wrap
         self.cpos = 0
         self.tab = 4
+        self.snap = False  # Move line starts left to a byte boundary
+
+        # Glyphs at byte aligned columns are copied straight into the
+        # buffer of MONO_HLSB drivers that say so (FB_FORMAT), see _put().
+        self._direct = (getattr(device, 'FB_FORMAT', None) == framebuf.MONO_HLSB
+                        and not device.width & 7)
+        self._put_params = array('i', (0, 0, 0, 0, 0))
 
         self.glyph = None  # Current char
         self.char_height = 0
         self.char_width = 0
         self.clip_width = 0
 
+        # Ready to blit glyph FrameBuffers keyed by char, least recently
+        # used first. One cache for normal and one for inverted rendering.
+        if glyph_cache_size is not None:
+            self.glyph_cache_size = glyph_cache_size
+        self.glyph_hits = 0
+        self.glyph_misses = 0
+        # Whole strings rendered into one FrameBuffer, keyed by
+        # (string, invert). Bounded by strip_budget bytes of pixel data.
+        if strip_budget is not None:
+            self.strip_budget = strip_budget
+        self._strip_bytes = 0
+        self.strip_hits = 0
+        self.strip_misses = 0
+
+    def _set_font(self, font):
+        if font.height() >= self.device.height or font.max_width() >= self.device.width:
+            raise ValueError('Font too large for screen')
+        # Allow to work with reverse or normal font mapping
+        if font.hmap():
+            self.map = framebuf.MONO_HMSB if font.reverse() else framebuf.MONO_HLSB
+        else:
+            raise ValueError('Font must be horizontally mapped.')
+        self._direct_font = self.map == framebuf.MONO_HLSB
+        self.font = font
+        # Ink bounds table, fonts without one are scanned by _truelen()
+        self._metrics = getattr(font, 'get_metrics', None)
+
+    # Change font. Cached glyphs and text runs belong to the old one.
+    def set_font(self, font):
+        self._set_font(font)
+        self.clear_cache()
+
     def _getstate(self):
         return Writer.state[self.devid]
 
+    def clear_cache(self):
+        for cache in self._glyphs:
+            cache.clear()
+        self._strips.clear()
+        self._strip_bytes = 0
+
+    def cache_info(self):
+        return {'glyphs': sum(len(c) for c in self._glyphs),
+                'glyph_hits': self.glyph_hits, 'glyph_misses': self.glyph_misses,
+                'strips': len(self._strips), 'strip_bytes': self._strip_bytes,
+                'strip_hits': self.strip_hits, 'strip_misses': self.strip_misses}
+
     def _newline(self):
         s = self._getstate()
         height = self.font.height()
@@ -121,6 +194,57 @@ class Writer():
     def height(self):  # Property for consistency with device
         return self.font.height()
 
+    # Horizontal extent of a line of text as (ink offset, width). Widths come
+    # from a table per font so nothing is rendered and no glyph is fetched
+    # twice. tight: measure from the first to the last lit column.
+    def _extent(self, line, tight):
+        table = Writer.widths.get(self.font)
+        if table is None:
+            table = Writer.widths[self.font] = {}
+        w = 0
+        for char in line:
+            cw = table.get(char)
+            if cw is None:
+                cw = table[char] = self.font.get_ch(char)[2]
+            w += cw
+        if not (tight and line):
+            return 0, w
+        left = self.ink(line[0])[0]
+        right = self.ink(line[-1])[1]
+        return left, max(0, w - left - (table[line[-1]] - right))
+
+    # Size of text in pixels as (width, height) without rendering it or
+    # moving the text position. Width is that of the widest line.
+    def measure(self, text, tight=False):
+        lines = text.split('\n')
+        return (max(self._extent(line, tight)[1] for line in lines),
+                len(lines) * self.font.height())
+
+    # Print text aligned in box = (x, y, width, height). align is 'left',
+    # 'center' or 'right', lines are aligned one by one and the block is
+    # centered vertically. Text wider than the box starts at its left edge.
+    def print_aligned(self, text, box, align='left', invert=False, tight=False):
+        if align not in ('left', 'center', 'right'):
+            raise ValueError('align must be left, center or right')
+        x, y, w, h = box
+        lines = text.split('\n')
+        height = self.font.height()
+        row = y + max(0, (h - len(lines) * height) // 2)
+        for line in lines:
+            offset, lw = self._extent(line, tight)
+            col = x
+            if align == 'right':
+                col = x + w - lw
+            elif align == 'center':
+                col = x + (w - lw) // 2
+            col = max(0, max(col, x) - offset)
+            if self.snap:
+                col &= ~7
+            Writer.set_textpos(self.device, col, row)
+            if line:
+                self._printline(line, invert)
+            row += height
+
     def printstring(self, string, invert=False):
         # word wrapping. Assumes words separated by single space.
         q = string.split('\n')
@@ -132,22 +256,117 @@ class Writer():
                 self._printchar('\n')
 
     def _printline(self, string, invert):
-        rstr = None
-        if self.wrap and self.stringlen(string, True):  # Length > self.screenwidth
-            pos = 0
-            lstr = string[:]
-            while self.stringlen(lstr, True):  # Length > self.screenwidth
-                pos = lstr.rfind(' ')
-                lstr = lstr[:pos].rstrip()
-            if pos > 0:
-                rstr = string[pos + 1:]
-                string = lstr
-                
-        for char in string:
-            self._printchar(char, invert)
-        if rstr is not None:
-            self._printchar('\n')
-            self._printline(rstr, invert)  # Recurse
+        lay = self.layout(string)
+        self._getstate().text_col = lay.lines[0][2]  # Snapped
+        glyphs = lay.glyphs
+        for n, line in enumerate(lay.lines):
+            if n:
+                self._printchar('\n')
+            if self._printstrip(lay, line, invert):
+                continue
+            for i in range(line[0], line[1]):
+                self._printchar(string[i], invert, glyph=glyphs[i])
+
+    # Split a line of text at word boundaries in one pass. Each glyph is
+    # fetched once and prefix widths make every fit test O(1). Breaks are
+    # the same as the old rfind(' ') loop: at the last space that leaves a
+    # fitting line, with trailing spaces dropped. A line with no usable
+    # space is not broken and is clipped when printed. snap (default
+    # self.snap) moves the start column left to a byte boundary.
+    def layout(self, string, col=None, snap=None):
+        if col is None:
+            col = self._getstate().text_col
+        if self.snap if snap is None else snap:
+            col &= ~7
+        get_ch = self.font.get_ch
+        glyphs = [get_ch(char) for char in string]
+        x = [0]
+        w = 0
+        for g in glyphs:
+            w += g[2]
+            x.append(w)
+        wd = self.screenwidth
+        n = len(string)
+
+        # Would string[start:end] drawn from column sc run off the screen?
+        def overflow(start, end, sc):
+            if end <= start or sc + x[end] - x[start] <= wd:
+                return False
+            last = sc + x[end - 1] - x[start]
+            return last > wd or last + self._truelen(string[end - 1]) > wd
+
+        lines = []
+        start = 0
+        while True:
+            if not (self.wrap and overflow(start, n, col)):
+                lines.append((start, n, col, not overflow(start, n, col)))
+                break
+            pos = -1
+            end = n
+            while overflow(start, end, col):
+                pos = string.rfind(' ', start, end)
+                if pos < 0:
+                    break
+                end = pos
+                while end > start and string[end - 1] == ' ':
+                    end -= 1
+            if pos <= start:
+                lines.append((start, n, col, False))
+                break
+            lines.append((start, end, col, True))
+            start = pos + 1
+            col = 0
+        return Layout(string, glyphs, x, lines)
+
+    # Print a laid out line that fits on the current row as one cached
+    # strip. Returns False if it must go through the per character path.
+    def _printstrip(self, lay, line, invert):
+        start, end, _, fits = line
+        if not self.strip_budget or not fits or end <= start:
+            return False
+        s = self._getstate()
+        if s.text_row + self.font.height() > self.screenheight:
+            return False  # Needs newline or scroll
+        if s.text_col + lay.width(start, end) > self.screenwidth:
+            return False  # Last glyph is clipped
+        string = lay.string[start:end]
+        if '\t' in string:
+            return False
+        key = (string, invert)
+        strip = self._strips.get(key)
+        if strip is not None:
+            self.strip_hits += 1
+            del self._strips[key]  # Move to most recently used end
+            self._strips[key] = strip
+        else:
+            self.strip_misses += 1
+            strip = self._render_strip(string, lay.glyphs[start:end], lay.width(start, end), invert)
+        fb, width, size = strip
+        self.device.blit(fb, s.text_col, s.text_row)
+        s.text_col += width
+        self.cpos += len(string)
+        return True
+
+    # Render string into a new strip and cache it if it fits the budget
+    def _render_strip(self, string, glyphs, width, invert):
+        height = self.font.height()
+        size = ((width + 7) // 8) * height
+        fb = framebuf.FrameBuffer(bytearray(size), width, height, framebuf.MONO_HLSB)
+        x = 0
+        for char, g in zip(string, glyphs):
+            self.glyph, self.char_height, self.char_width = g
+            self.clip_width = self.char_width
+            fb.blit(self._glyph_fb(char, invert), x, 0)
+            x += self.char_width
+        self.glyph = None
+        strip = (fb, width, size)
+        if size <= self.strip_budget:
+            strips = self._strips
+            while strips and self._strip_bytes + size > self.strip_budget:
+                self._strip_bytes -= strips.pop(next(iter(strips)))[2]
+            strips[(string, invert)] = strip
+            self._strip_bytes += size
+        return strip
 
     def stringlen(self, string, oh=False):
         if not len(string):
@@ -168,29 +387,23 @@ class Writer():
             l += char_width  # Public method. Return same value as old code.
         return l + sc > wd if oh else l
 
+    # Ink bounds of a glyph: left, right, top, bottom. Right and bottom are
+    # exclusive, all are 0 for a blank glyph.
+    def ink(self, char):
+        if self._metrics is not None:
+            return tuple(self._metrics(char))
+        glyph, ht, wd = self.font.get_ch(char)
+        bounds = bytearray(4)
+        _ink_bounds(glyph, wd, ht, bounds)
+        return tuple(bounds)
+
     # Return the printable width of a glyph less any blank columns on RHS
     def _truelen(self, char):
-        glyph, ht, wd = self.font.get_ch(char)
-        div, mod = divmod(wd, 8)
-        gbytes = div + 1 if mod else div  # No. of bytes per row of glyph
-        mc = 0  # Max non-blank column
-        data = glyph[(wd - 1) // 8]  # Last byte of row 0
-        for row in range(ht):  # Glyph row
-            for col in range(wd -1, -1, -1):  # Glyph column
-                gbyte, gbit = divmod(col, 8)
-                if gbit == 0:  # Next glyph byte
-                    data = glyph[row * gbytes + gbyte]
-                if col <= mc:
-                    break
-                if data & (1 << (7 - gbit)):  # Pixel is lit (1)
-                    mc = col  # Eventually gives rightmost lit pixel
-                    break
-            if mc + 1 == wd:
-                break  # All done: no trailing space
-        # print('Truelen', char, wd, mc + 1)  # TEST 
-        return mc + 1
+        if self._metrics is not None:
+            return self._metrics(char)[1] or 1
+        return self.ink(char)[1] or 1
 
-    def _get_char(self, char, recurse):
+    def _get_char(self, char, recurse, glyph=None):
         if not recurse:  # Handle tabs
             if char == '\n':
                 self.cpos = 0
@@ -208,7 +421,7 @@ class Writer():
         if char == '\n':
             self._newline()
             return
-        glyph, char_height, char_width = self.font.get_ch(char)
+        glyph, char_height, char_width = glyph or self.font.get_ch(char)
         s = self._getstate()
         np = None  # Allow restriction on printable columns
         if s.text_row + char_height > self.screenheight:
@@ -228,22 +441,64 @@ class Writer():
         self.char_width = char_width
         self.clip_width = char_width if np is None else np
         
+    # Build a FrameBuffer for a glyph, inverted if required
+    def _render(self, glyph, height, width, invert):
+        buf = bytearray(glyph)
+        if invert:
+            _invert(buf, len(buf))
+        return framebuf.FrameBuffer(buf, width, height, self.map)
+
+    # Return the FrameBuffer for the current char, from the cache if possible.
+    # Clipped glyphs are rare and bypass the cache.
+    def _glyph_fb(self, char, invert):
+        if self.clip_width != self.char_width or not self.glyph_cache_size:
+            return self._render(self.glyph, self.char_height, self.clip_width, invert)
+        cache = self._glyphs[1 if invert else 0]
+        fbc = cache.get(char)
+        if fbc is not None:
+            self.glyph_hits += 1
+            del cache[char]  # Move to most recently used end
+            cache[char] = fbc
+            return fbc
+        self.glyph_misses += 1
+        fbc = self._render(self.glyph, self.char_height, self.char_width, invert)
+        cache[char] = fbc
+        if len(cache) > self.glyph_cache_size:
+            del cache[next(iter(cache))]
+        return fbc
+
     # Method using blitting. Efficient rendering for monochrome displays.
     # Tested on SSD1306. Invert is for black-on-white rendering.
-    def _printchar(self, char, invert=False, recurse=False):
+    def _printchar(self, char, invert=False, recurse=False, glyph=None):
         s = self._getstate()
-        self._get_char(char, recurse)
+        self._get_char(char, recurse, glyph)
         if self.glyph is None:
             return  # All done
-        buf = bytearray(self.glyph)
-        if invert:
-            for i, v in enumerate(buf):
-                buf[i] = 0xFF & ~ v
-        fbc = framebuf.FrameBuffer(buf, self.clip_width, self.char_height, self.map)
-        self.device.blit(fbc, s.text_col, s.text_row)
+        if self.clip_width != self.char_width or not self._put(
+                self.glyph, self.char_height, self.char_width, s.text_col, s.text_row, invert):
+            fbc = self._glyph_fb(char, invert)
+            self.device.blit(fbc, s.text_col, s.text_row)
         s.text_col += self.char_width
         self.cpos += 1
 
+    # Copy a glyph straight into the device buffer if col is a multiple of
+    # 8 and the glyph lies wholly on the device. Same result as a blit
+    # without the FrameBuffer. Returns False if a blit is needed.
+    def _put(self, glyph, height, width, col, row, invert):
+        device = self.device
+        if (col & 7 or not (self._direct and self._direct_font) or row < 0 or col < 0
+                or row + height > device.height or col + width > device.width):
+            return False
+        stride = device.width >> 3
+        p = self._put_params
+        p[0] = row * stride + (col >> 3)
+        p[1] = stride
+        p[2] = height
+        p[3] = width
+        p[4] = 1 if invert else 0
+        _put_rows(device.buffer, glyph, p)
+        return True
+
     def tabsize(self, value=None):
         if value is not None:
             self.tab = value
@@ -252,6 +507,80 @@ class Writer():
     def setcolor(self, *_):
         return self.fgcolor, self.bgcolor
 
+# A screenful of text described as (writer, x, y, text) items and drawn in
+# one batch. Items are grouped by writer, every distinct character of a
+# group is resolved to a glyph FrameBuffer once and blitted straight to the
+# device, or copied into its buffer at byte aligned columns: no text
+# position state, range checks or word wrap. Each line of an item starts at
+# its x (snapped if the writer's snap is set), text running off the device
+# is clipped by blit.
+class DrawList():
+    def __init__(self, device, invert=False):
+        self.device = device
+        self.invert = invert  # Default for add()
+        self.items = []
+
+    def add(self, writer, x, y, text, invert=None):
+        self.items.append((writer, x, y, text, self.invert if invert is None else invert))
+
+    def clear(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    # Glyph FrameBuffers and widths of chars, reusing the writer's cache.
+    # Glyphs beyond the cache size are kept for this batch only.
+    def _resolve(self, writer, chars, invert):
+        cache = writer._glyphs[1 if invert else 0]
+        get_ch = writer.font.get_ch
+        fbs = {}
+        for char in chars:
+            glyph, height, width = get_ch(char)
+            fbc = cache.get(char)
+            if fbc is None:
+                writer.glyph_misses += 1
+                fbc = writer._render(glyph, height, width, invert)
+                if len(cache) < writer.glyph_cache_size:
+                    cache[char] = fbc
+            else:
+                writer.glyph_hits += 1
+            fbs[char] = (fbc, glyph, height, width)
+        return fbs
+
+    def draw(self, clear=True):
+        groups = {}
+        for item in self.items:
+            key = (item[0], item[4])
+            if key in groups:
+                groups[key].append(item)
+            else:
+                groups[key] = [item]
+        blit = self.device.blit
+        for (writer, invert), items in groups.items():
+            chars = set()
+            for item in items:
+                chars.update(item[3])
+            chars.discard('\n')
+            fbs = self._resolve(writer, chars, invert)
+            put = writer._put
+            lh = writer.font.height()
+            for _, x0, y, text, _ in items:
+                if writer.snap:
+                    x0 &= ~7
+                x = x0
+                for char in text:
+                    if char == '\n':
+                        x = x0
+                        y += lh
+                        continue
+                    fbc, glyph, height, width = fbs[char]
+                    if not put(glyph, height, width, x, y, invert):
+                        blit(fbc, x, y)
+                    x += width
+        if clear:
+            self.items = []
+
 # Writer for colour displays.
 class CWriter(Writer):
 
@@ -281,9 +610,9 @@ class CWriter(Writer):
         self.def_bgcolor = self.bgcolor
         self.def_fgcolor = self.fgcolor
 
-    def _printchar(self, char, invert=False, recurse=False):
+    def _printchar(self, char, invert=False, recurse=False, glyph=None):
         s = self._getstate()
-        self._get_char(char, recurse)
+        self._get_char(char, recurse, glyph)
         if self.glyph is None:
             return  # All done
         buf = bytearray_at(addressof(self.glyph), len(self.glyph))